@@ -0,0 +1,181 @@
+"""Benchmark ForestMap generation over a sweep of map sizes.
+
+Each case builds a map with a fixed random seed and reports the time spent in
+each phase of generation (see map.MAP_PHASES, plus labeling) and the peak
+memory allocated while building it. Two sweeps are run for every target cell
+count: one keeps the window size and shrinks min_distance, the other keeps the
+default min_distance and grows the map.
+
+Run it from an environment where tone_poem is installed:
+
+    python benchmarks/map_generation.py --cells 100 1000 10000 100000
+"""
+
+import argparse
+import os
+import random
+import tracemalloc
+from math import sqrt
+from statistics import mean
+from time import perf_counter
+
+# tone_poem imports Kivy, which takes over the command line unless told not to
+os.environ["KIVY_NO_ARGS"] = "1"
+
+from tone_poem import map, map_label, voronoi  # noqa: E402
+from tone_poem.poisson import poisson_disk  # noqa: E402
+from tone_poem.tools import WINDOW_SIZE, Size  # noqa: E402
+
+# Bridson sampling with k=30 places about this many points per r^2 of area.
+POISSON_DENSITY = 0.63
+
+MARGIN = 60
+
+PHASES = map.MAP_PHASES + ("labels",)
+
+
+def cases(cells: int):
+    """Generate (name, dims, min_distance) for a target number of cells."""
+    area = (WINDOW_SIZE.w - 2 * MARGIN) * (WINDOW_SIZE.h - 2 * MARGIN)
+    yield (
+        f"window/{cells}",
+        WINDOW_SIZE,
+        sqrt(POISSON_DENSITY * area / cells),
+    )
+
+    min_distance = sum(WINDOW_SIZE) / 18
+    scale = sqrt(cells * min_distance**2 / POISSON_DENSITY / area)
+    yield (
+        f"scaled/{cells}",
+        Size(
+            round((WINDOW_SIZE.w - 2 * MARGIN) * scale) + 2 * MARGIN,
+            round((WINDOW_SIZE.h - 2 * MARGIN) * scale) + 2 * MARGIN,
+        ),
+        min_distance,
+    )
+
+
+def build(dims: Size, min_distance: float, seed: int, on_phase=None, **options):
+    """Build a labeled map; options are passed on to ForestMap."""
+    rng = random.Random(seed)
+    forest = map.ForestMap(
+        margin=MARGIN,
+        dims=dims,
+        min_distance=min_distance,
+        on_phase=on_phase,
+        rng=rng,
+        **options,
+    )
+    if on_phase:
+        on_phase("labels")
+    forest.add_labels(map_label.NodeNote, rng)
+    return forest
+
+
+def time_phases(dims: Size, min_distance: float, seed: int, **options):
+    """Build a map, returning its node count and the seconds per phase."""
+    marks = []
+    forest = build(
+        dims,
+        min_distance,
+        seed,
+        on_phase=lambda name: marks.append((name, perf_counter())),
+        **options,
+    )
+    marks.append((None, perf_counter()))
+    timings = {
+        name: end - start for (name, start), (_, end) in zip(marks, marks[1:])
+    }
+    return forest.graph.number_of_nodes(), timings
+
+
+def peak_memory(dims: Size, min_distance: float, seed: int, **options) -> int:
+    """Build a map, returning the peak number of bytes allocated."""
+    tracemalloc.start()
+    try:
+        build(dims, min_distance, seed, **options)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--cells",
+        type=int,
+        nargs="+",
+        default=[100, 1000, 10000, 100000],
+        help="target numbers of map cells",
+    )
+    parser.add_argument(
+        "--seeds", type=int, nargs="+", default=[0, 1, 2], help="RNG seeds"
+    )
+    parser.add_argument(
+        "--backend",
+        choices=voronoi.BACKENDS,
+        default="fortune",
+        help="how to compute the Voronoi diagram",
+    )
+    parser.add_argument(
+        "--poisson-backend",
+        choices=poisson_disk.BACKENDS,
+        default="python",
+        help="how to sample the map's points",
+    )
+    parser.add_argument(
+        "--poisson-processes",
+        type=int,
+        default=1,
+        help="sample big maps in tiles on this many processes (0 for all CPUs)",
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="skip the (slower) traced run measuring peak memory",
+    )
+    args = parser.parse_args()
+    options = dict(
+        voronoi_backend=args.backend,
+        poisson_backend=args.poisson_backend,
+        poisson_processes=args.poisson_processes or None,
+    )
+
+    header = ["case", "dims", "r", "nodes"]
+    header += [f"{phase} ms" for phase in PHASES]
+    header += ["total ms", "peak MiB"]
+    print("\t".join(header))
+    for cells in args.cells:
+        for name, dims, min_distance in cases(cells):
+            runs = [
+                time_phases(dims, min_distance, s, **options)
+                for s in args.seeds
+            ]
+            phase_ms = [
+                1000 * mean(timings[phase] for _, timings in runs)
+                for phase in PHASES
+            ]
+            if args.no_memory:
+                peak = "-"
+            else:
+                peak = "{:.1f}".format(
+                    max(
+                        peak_memory(dims, min_distance, s, **options)
+                        for s in args.seeds
+                    )
+                    / 2**20
+                )
+            row = [
+                name,
+                f"{dims.w}x{dims.h}",
+                f"{min_distance:.1f}",
+                str(round(mean(nodes for nodes, _ in runs))),
+            ]
+            row += [f"{ms:.1f}" for ms in phase_ms]
+            row += [f"{sum(phase_ms):.1f}", peak]
+            print("\t".join(row), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,13 @@
 import json
 import os
+import random
 from collections import defaultdict
 from functools import partial
 from itertools import chain, repeat
-from math import copysign, sqrt
-from random import choice, gauss
+from math import sqrt
 
 from kivy.animation import Animation, AnimationTransition
+from kivy.clock import Clock
 from kivy.core.image import Image
 from kivy.event import EventDispatcher
 from kivy.graphics import Color, Line, Mesh, RenderContext
@@ -21,10 +22,12 @@ from kivy.uix.screenmanager import Screen
 from kivy.uix.widget import Widget
 from pydantic.dataclasses import dataclass
 
-from . import map, map_label
+from . import map, map_cache, map_label, world_map
 from .beastie import NoteCollector
+from .compact_map import CompactGraphMap
 from .creature import PlayerCharacter
 from .creature_widget import CreatureWidget
+from .map_builder import MapBuilder
 from .mingushelpers import notes_match
 from .tools import (
     ROOT_DIR,
@@ -36,7 +39,6 @@ from .tools import (
     Size,
     distance_squared,
     edges_to_vec4s,
-    safe_divide,
     vertices_to_edges,
 )
 
@@ -91,6 +93,12 @@ class MapRenderer(EventDispatcher):
 
     ground_tile = None
 
+    def __init__(self, rng=None, **kw):
+        super(MapRenderer, self).__init__(**kw)
+        # decides everything drawn at random, like where trees go; the
+        # random module's own functions if rng is None
+        self.rng = rng or random
+
     def draw_paths(self, paths):
         return
 
@@ -178,7 +186,7 @@ class ForestMapRenderer(SkeletronMapRenderer):
         self.wall_meshes = []
 
     def _choose_tex(self):
-        return choice(list(self.uvs.values()))
+        return self.rng.choice(list(self.uvs.values()))
 
     def _mesh_box(
         self, uvs, x, y, scale=1.0
@@ -244,7 +252,7 @@ class ForestMapRenderer(SkeletronMapRenderer):
         x, y = v1
         x_going_right = dx > 0
         while y > v2.y and ((x < v2.x) == x_going_right):
-            jitter = gauss(0, 0.25)
+            jitter = self.rng.gauss(0, 0.25)
             indices.extend(self._triangle_indices(len(verts)))
             verts.extend(
                 self._mesh_box(
@@ -302,14 +310,6 @@ class MapLabel(Label):
     pass
 
 
-# XXX: Unit test this SO MUCH
-def sort_counterclockwise_key(center, point):
-    return (
-        copysign(-1, point.y - center.y),
-        -safe_divide(point.x - center.x, point.y - center.y),
-    )
-
-
 def get_triangular_indices(num_vertices):
     vertices = range(num_vertices)
     return list(
@@ -317,17 +317,6 @@ def get_triangular_indices(num_vertices):
     )
 
 
-def get_corner_vert(verts):
-    corner_vert = [None, None]
-    for v in verts:
-        if v.x <= 0 or v.x >= WINDOW_SIZE.w:
-            corner_vert[0] = v.x
-        if v.y <= 0 or v.y >= WINDOW_SIZE.h:
-            corner_vert[1] = v.y
-    if all(c is not None for c in corner_vert):
-        return corner_vert
-
-
 class ShadeTile(Widget):
     mesh_indices = ListProperty([])
     mesh_verts = ListProperty([])
@@ -372,29 +361,21 @@ class ShadeTile(Widget):
 
 
 class MapOverlay(RelativeLayout):
-    wall_dict: dict[Coords, tuple[Coords, Coords]]
+    cells: dict[Coords, list[Coords]]
     widgets: dict[Coords, Widget]
     clear: set[Coords]
 
-    def __init__(self, wall_dict, **kw):
-        self.wall_dict = wall_dict
+    def __init__(self, cells, **kw):
+        self.cells = cells
         super(MapOverlay, self).__init__(**kw)
         self.widgets = dict()
         self.clear = set()
 
     def setup_fog(self, clear=None) -> None:
         self.clear = clear or set()
-        for center_vertex, walls in self.wall_dict.items():
-            verts: set[Coords] = set(chain.from_iterable(walls))
-            if corner_vert := get_corner_vert(verts):
-                verts.add(Coords(*corner_vert))
-
-            sorted_verts: list[Coords] = sorted(
-                verts, key=partial(sort_counterclockwise_key, center_vertex)
-            )
-
+        for center_vertex, cell in self.cells.items():
             mesh_verts = []
-            for i, vert_coord in enumerate(sorted_verts):
+            for vert_coord in cell:
                 x, y = vert_coord.display_tuple
                 mesh_verts.extend(
                     [
@@ -406,8 +387,8 @@ class MapOverlay(RelativeLayout):
                     ]
                 )
 
-            edges: list[tuple[Coords, Coords]] = vertices_to_edges(sorted_verts)
-            # Logger.info(f"{center_vertex=}, {sorted_verts=}")
+            edges: list[tuple[Coords, Coords]] = vertices_to_edges(cell)
+            # Logger.info(f"{center_vertex=}, {cell=}")
             shade_widget = ShadeTile(
                 edges=[
                     (v1.display_tuple, v2.display_tuple) for v1, v2 in edges
@@ -538,21 +519,160 @@ class AreaScreen(Screen):
     pc_loc: Coords
 
     def __init__(self, **kw):
-        self.map = map.ForestMap(margin=AreaScreen.margin)
-        self.map.add_labels(map_label.NodeNote)
-        self.renderer = kw.get("renderer", ForestMapRenderer)()
-        self.vertices_pos = self.map.graph.nodes()
+        map_cache_dir = kw.pop("map_cache_dir", None)
+        map_seed = kw.pop("map_seed", None)
+        tiled_world = kw.pop("tiled_world", False)
+        compact = kw.pop("compact_map", False)
+        self.renderer = kw.get("renderer", ForestMapRenderer)(
+            rng=None
+            if map_seed is None
+            else random.Random(f"{map_seed}:renderer")
+        )
+        # picks the node the PC starts on
+        self.start_rng = (
+            random if map_seed is None else random.Random(f"{map_seed}:start")
+        )
+        self.map = None
         self.pc = PlayerCharacter("Valrus", "sprites/walrus")
-        self.pc_loc = choice(list(self.vertices_pos))
         self.nav_widgets = []
+        # cells the PC has been to, so fog stays lifted when layers are rebuilt
+        self.revealed = set()
+        # builds the records of a tiled world's chunks as the PC nears them
+        self.chunk_builder = None
         super(AreaScreen, self).__init__(**kw)
+        self.ear = NoteCollector()
+
+        # Generating a map can take a while, so do it off the main thread and
+        # show what it's up to until it's done.
+        self.placeholder = Label(text="Generating map...", font_size=32)
+        self.add_widget(self.placeholder)
+        self.map_builder = MapBuilder(
+            partial(
+                self.build_map,
+                tiled_world=tiled_world,
+                compact=compact,
+                map_cache_dir=map_cache_dir,
+                map_seed=map_seed,
+            ),
+            on_progress=lambda *progress: Clock.schedule_once(
+                partial(self.on_map_progress, *progress)
+            ),
+            on_done=lambda graph_map: Clock.schedule_once(
+                partial(self.on_map_ready, graph_map)
+            ),
+            on_error=lambda e: Clock.schedule_once(
+                partial(self.on_map_error, e)
+            ),
+        ).start()
+
+    @staticmethod
+    def build_map(on_phase, *, tiled_world, compact, map_cache_dir, map_seed):
+        """Generate (or load) a labeled map. Runs on the map builder thread.
+
+        Tiled worlds change as the PC moves, so compact is ignored for them.
+        """
+        if tiled_world:
+            graph_map = world_map.TiledForestMap(seed=map_seed or 0)
+            graph_map.add_labels(map_label.NodeNote)
+            return graph_map
+        if map_cache_dir and map_seed is not None:
+            graph_map = map_cache.load_or_generate(
+                map_cache_dir,
+                map_type=map.ForestMap,
+                nodeType=map_label.NodeNote,
+                seed=map_seed,
+                margin=AreaScreen.margin,
+                on_phase=on_phase,
+            )
+        else:
+            rng = None if map_seed is None else random.Random(map_seed)
+            graph_map = map.ForestMap(
+                margin=AreaScreen.margin, on_phase=on_phase, rng=rng
+            )
+            on_phase("labels")
+            graph_map.add_labels(map_label.NodeNote, rng)
+        if compact:
+            return CompactGraphMap.from_map(graph_map)
+        return graph_map
+
+    def on_map_progress(self, name, index, count, *args):
+        self.placeholder.text = f"Generating map: {name} ({index + 1}/{count})"
+
+    def on_map_error(self, error, *args):
+        Logger.error(f"AreaScreen: map generation failed: {error!r}")
+        self.placeholder.text = f"Couldn't generate map: {error}"
+
+    def on_map_ready(self, graph_map, *args):
+        self.map = graph_map
+        self.vertices_pos = self.map.nodes()
+        # sorted, so a cached map starts the PC where a fresh one would
+        self.pc_loc = self.start_rng.choice(sorted(self.vertices_pos))
+        self.remove_widget(self.placeholder)
+        self.add_layers()
+
+    def add_layers(self):
         self.terrain = MapTerrain(renderer=self.renderer)
         self.add_widget(self.terrain)
         self.features = MapFeatures(renderer=self.renderer)
         self.add_widget(self.features)
-        self.overlay = MapOverlay(self.map.wall_dict)
+        self.overlay = MapOverlay(self.map.cells)
         self.add_widget(self.overlay)
-        self.ear = NoteCollector()
+        self.scroll_layers()
+
+    def scroll_layers(self):
+        """Keep the chunk the PC is in on screen, for tiled worlds."""
+        if not isinstance(self.map, world_map.TiledForestMap):
+            return
+        origin = self.map.chunk_origin(self.map.chunk_of(self.pc_loc))
+        for layer in (self.terrain, self.features, self.overlay):
+            layer.pos = (-origin.x, -origin.y)
+
+    def rebuild_layers(self):
+        """Redraw everything after the map's nodes have changed."""
+        for layer in (self.terrain, self.features, self.overlay):
+            self.remove_widget(layer)
+        self.nav_widgets = []
+        self.vertices_pos = self.map.nodes()
+        self.add_layers()
+
+    def finish_move(self, *args):
+        if isinstance(self.map, world_map.TiledForestMap):
+            missing = self.map.missing_records(self.pc_loc)
+            if missing:
+                # Chunks are only loaded once the PC is within load_distance,
+                # so it can keep moving on the loaded ones meanwhile.
+                self.build_chunks(missing)
+            elif self.map.update(self.pc_loc):
+                self.rebuild_layers()
+                return
+        self.scroll_layers()
+        self.reset_navigation_widgets()
+
+    def build_chunks(self, chunks):
+        """Build the records of a tiled world's chunks off the main thread,
+        and move on once they're ready."""
+        if self.chunk_builder is not None:
+            # on_chunks_ready checks again for whatever else is missing
+            return
+        self.chunk_builder = MapBuilder(
+            lambda on_phase: self.map.build_records(chunks),
+            on_done=lambda records: Clock.schedule_once(
+                partial(self.on_chunks_ready, records)
+            ),
+            on_error=lambda e: Clock.schedule_once(
+                partial(self.on_chunks_error, e)
+            ),
+            phases=(),
+        ).start()
+
+    def on_chunks_ready(self, records, *args):
+        self.chunk_builder = None
+        self.map.add_records(records)
+        self.finish_move()
+
+    def on_chunks_error(self, error, *args):
+        self.chunk_builder = None
+        Logger.error(f"AreaScreen: chunk generation failed: {error!r}")
 
     def on_midi_in(self, instance, value):
         value.watchers.add(self)
@@ -570,7 +690,8 @@ class AreaScreen(Screen):
         self.reset_navigation_widgets()
 
     def on_overlay(self, instance, value):
-        value.setup_fog(clear={self.pc_loc})
+        self.revealed.add(self.pc_loc)
+        value.setup_fog(clear=self.revealed & set(value.cells))
 
     def reset_navigation_widgets(self, *args):
         """Set up labels describing how to move the PC.
@@ -583,7 +704,7 @@ class AreaScreen(Screen):
         self.nav_widgets = get_navigation_widgets(
             start=self.pc_loc,
             graph_map=self.map,
-            edges=list(self.map.graph.edges([self.pc_loc])),
+            edges=list(self.map.edges([self.pc_loc])),
         )
         for w in self.nav_widgets:
             # print("adding widget", w.text, "with center", w.center)
@@ -598,8 +719,11 @@ class AreaScreen(Screen):
                 clear_edges[loc].append(adjacent_edge)
                 self.overlay.reveal(adjacent_node, clear_edges)
         self.overlay.reveal(loc, clear_edges)
+        self.revealed.add(loc)
 
     def on_midi(self, msg):
+        if self.map is None:
+            return
         self.ear.hear(msg)
         if not self.ear.heard_count() >= 1:
             return
@@ -614,7 +738,7 @@ class AreaScreen(Screen):
                     duration=0.5,
                     transition=AnimationTransition.in_out_quad,
                 )
-                anim.on_complete = self.reset_navigation_widgets
+                anim.on_complete = self.finish_move
                 if self.overlay:
                     anim.on_start = partial(self.reveal_map_areas, self.pc_loc)
                 print(self.map.wall_between_nodes(prev_loc, self.pc_loc))
@@ -623,7 +747,7 @@ class AreaScreen(Screen):
     def draw_edges(self):
         """Draw lines between this map's vertices."""
         self.renderer.draw_paths(
-            [[v1, v2] for v1, v2 in self.map.graph.edges(self.vertices_pos)]
+            [[v1, v2] for v1, v2 in self.map.edges(self.vertices_pos)]
         )
 
     def draw_walls(self):
@@ -0,0 +1,266 @@
+"""A read-only, array-backed copy of a GraphMap.
+
+GraphMap keeps two networkx graphs keyed by Coords, with a dict of attributes
+per edge, which costs a few kilobytes per node. CompactGraphMap stores the
+same map in flat arrays instead:
+
+- nodes get integer ids, in (x, y) order, with their coordinates in two
+  parallel arrays so a Coords can be turned back into an id by bisection;
+- both the pruned graph and the full adjacency are stored CSR-style, as an
+  offsets array into a single array of neighbor ids;
+- walls are stored once, as rows of four coordinates, referred to by id from
+  the adjacency (one wall id per neighbor entry) and from each node's cell;
+- the corners of each node's cell polygon are stored CSR-style as well, as
+  pairs of coordinates in one array;
+- labels are stored as their names, one byte per node indexing a table of
+  the distinct names, and only rebuilt when asked for.
+
+It answers the same queries as GraphMap, so it can stand in for one once the
+map is finished and labeled.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Iterator
+
+from .map import GraphMap
+from .map_label import NamedLabel, NodeLabel
+from .tools import Coords, Size
+
+Wall = tuple[Coords, Coords]
+
+NO_WALL = -1
+
+NO_LABEL = -1
+
+
+def _csr(
+    neighbor_lists: list[list[int]],
+) -> tuple[array, array]:
+    offsets = array("i", [0])
+    targets = array("i")
+    for neighbors in neighbor_lists:
+        targets.extend(neighbors)
+        offsets.append(len(targets))
+    return offsets, targets
+
+
+class CompactGraphMap:
+    dims: Size
+    margin: int
+    min_distance: float
+
+    def __init__(
+        self,
+        *,
+        dims: Size,
+        margin: int,
+        min_distance: float,
+        nodes: list[Coords],
+        edges: Iterable[tuple[Coords, Coords]],
+        adjacency: Iterable[tuple[Coords, Coords, Wall | None]],
+        walls: list[Wall],
+        wall_dict: dict[Coords, list[Wall]],
+        cells: dict[Coords, list[Coords]],
+        labels: dict[Coords, NamedLabel] | None = None,
+    ):
+        self.dims = dims
+        self.margin = margin
+        self.min_distance = min_distance
+
+        nodes = sorted(nodes)
+        self._xs = array("d", (node.x for node in nodes))
+        self._ys = array("d", (node.y for node in nodes))
+        ids = {node: i for i, node in enumerate(nodes)}
+
+        self._wall_coords = array("d")
+        wall_ids: dict[Wall, int] = {}
+        for wall in walls:
+            self._add_wall(wall, wall_ids)
+
+        connected: list[list[int]] = [[] for _ in nodes]
+        for n1, n2 in edges:
+            connected[ids[n1]].append(ids[n2])
+            connected[ids[n2]].append(ids[n1])
+        self._graph_offsets, self._graph_targets = _csr(connected)
+
+        adjacent: list[list[tuple[int, int]]] = [[] for _ in nodes]
+        for n1, n2, wall in adjacency:
+            wall_id = (
+                NO_WALL if wall is None else self._add_wall(wall, wall_ids)
+            )
+            adjacent[ids[n1]].append((ids[n2], wall_id))
+            adjacent[ids[n2]].append((ids[n1], wall_id))
+        self._adjacency_offsets, self._adjacency_targets = _csr(
+            [[neighbor for neighbor, _ in entries] for entries in adjacent]
+        )
+        self._adjacency_walls = array(
+            "i", (wall_id for entries in adjacent for _, wall_id in entries)
+        )
+
+        self._cell_offsets, self._cell_walls = _csr(
+            [
+                [self._add_wall(wall, wall_ids) for wall in wall_dict[node]]
+                for node in nodes
+            ]
+        )
+
+        self._corner_offsets = array("i", [0])
+        self._corners = array("d")
+        for node in nodes:
+            for corner in cells[node]:
+                self._corners.extend(corner)
+            self._corner_offsets.append(len(self._corners) // 2)
+
+        labels = labels or {}
+        label_types = {type(label) for label in labels.values()}
+        if len(label_types) > 1:
+            raise ValueError("labels must all be of one type")
+        self._label_type: type[NamedLabel] | None = (
+            label_types.pop() if label_types else None
+        )
+        self._label_names: list[str] = sorted(
+            {str(label) for label in labels.values()}
+        )
+        name_ids = {name: i for i, name in enumerate(self._label_names)}
+        self._label_ids = array(
+            "b",
+            (
+                NO_LABEL if node not in labels else name_ids[str(labels[node])]
+                for node in nodes
+            ),
+        )
+
+    @classmethod
+    def from_map(cls, graph_map: GraphMap) -> "CompactGraphMap":
+        return cls(
+            dims=graph_map.dims,
+            margin=graph_map.margin,
+            min_distance=graph_map.min_distance,
+            nodes=list(graph_map.adjacency.nodes()),
+            edges=graph_map.graph.edges(),
+            adjacency=graph_map.adjacency.edges(data="wall"),
+            walls=[wall for wall in graph_map.walls if wall is not None],
+            wall_dict=graph_map.wall_dict,
+            cells=graph_map.cells,
+            labels=dict(graph_map.graph.nodes(data="label")),
+        )
+
+    def _add_wall(self, wall: Wall, wall_ids: dict[Wall, int]) -> int:
+        if wall not in wall_ids:
+            wall_ids[wall] = len(self._wall_coords) // 4
+            (x1, y1), (x2, y2) = wall
+            self._wall_coords.extend((x1, y1, x2, y2))
+        return wall_ids[wall]
+
+    def _wall(self, wall_id: int) -> Wall:
+        x1, y1, x2, y2 = self._wall_coords[4 * wall_id : 4 * wall_id + 4]
+        return (Coords(x1, y1), Coords(x2, y2))
+
+    def _coords(self, node_id: int) -> Coords:
+        return Coords(self._xs[node_id], self._ys[node_id])
+
+    def _id(self, node: Coords) -> int:
+        lo = bisect_left(self._xs, node.x)
+        hi = bisect_right(self._xs, node.x, lo)
+        i = bisect_left(self._ys, node.y, lo, hi)
+        if i == hi or self._ys[i] != node.y:
+            raise KeyError(node)
+        return i
+
+    def _neighbors(self, offsets: array, targets: array, node: Coords):
+        node_id = self._id(node)
+        for i in range(offsets[node_id], offsets[node_id + 1]):
+            yield self._coords(targets[i])
+
+    def __len__(self) -> int:
+        return len(self._xs)
+
+    def nodes(self) -> list[Coords]:
+        return [self._coords(i) for i in range(len(self))]
+
+    def edges(
+        self, nbunch: Iterable[Coords] | None = None
+    ) -> Iterator[tuple[Coords, Coords]]:
+        """Generate the connected edges, each once, like nx.Graph.edges."""
+        node_ids = (
+            range(len(self))
+            if nbunch is None
+            else sorted({self._id(node) for node in nbunch})
+        )
+        seen = set()
+        for node_id in node_ids:
+            seen.add(node_id)
+            start, end = (
+                self._graph_offsets[node_id],
+                self._graph_offsets[node_id + 1],
+            )
+            for neighbor_id in self._graph_targets[start:end]:
+                if neighbor_id not in seen:
+                    yield self._coords(node_id), self._coords(neighbor_id)
+
+    @property
+    def walls(self) -> list[Wall]:
+        return [self._wall(i) for i in range(len(self._wall_coords) // 4)]
+
+    @property
+    def wall_dict(self) -> dict[Coords, list[Wall]]:
+        return {node: self.walls_for_node(node) for node in self.nodes()}
+
+    @property
+    def cells(self) -> dict[Coords, list[Coords]]:
+        return {node: self.cell_for_node(node) for node in self.nodes()}
+
+    def connected_neighbors(self, node: Coords) -> Iterator[Coords]:
+        """Get all neighbors of a node with an edge connecting them."""
+        return self._neighbors(self._graph_offsets, self._graph_targets, node)
+
+    def all_neighbors(self, node: Coords) -> Iterator[Coords]:
+        """Get all neighbors of a node even if there's no edge between them."""
+        return self._neighbors(
+            self._adjacency_offsets, self._adjacency_targets, node
+        )
+
+    def walls_for_node(self, node: Coords) -> list[Wall]:
+        node_id = self._id(node)
+        start, end = (
+            self._cell_offsets[node_id],
+            self._cell_offsets[node_id + 1],
+        )
+        return [self._wall(i) for i in self._cell_walls[start:end]]
+
+    def cell_for_node(self, node: Coords) -> list[Coords]:
+        node_id = self._id(node)
+        start, end = (
+            self._corner_offsets[node_id],
+            self._corner_offsets[node_id + 1],
+        )
+        return [
+            Coords(self._corners[2 * i], self._corners[2 * i + 1])
+            for i in range(start, end)
+        ]
+
+    def wall_between_nodes(self, n1: Coords, n2: Coords) -> Wall:
+        id1, id2 = self._id(n1), self._id(n2)
+        start, end = (
+            self._adjacency_offsets[id1],
+            self._adjacency_offsets[id1 + 1],
+        )
+        for i in range(start, end):
+            if self._adjacency_targets[i] == id2:
+                wall_id = self._adjacency_walls[i]
+                if wall_id == NO_WALL:
+                    # GraphMap raises the same for adjacent nodes without one
+                    raise KeyError("wall")
+                return self._wall(wall_id)
+        raise KeyError((n1, n2))
+
+    def node_label(self, node: Coords) -> NodeLabel:
+        """Get a node's label, rebuilt from its name: a new one every time."""
+        name_id = self._label_ids[self._id(node)]
+        if name_id == NO_LABEL:
+            raise KeyError("label")
+        return self._label_type.from_name(self._label_names[name_id])
+
+    def edge_label(self, n1: Coords, n2: Coords):
+        return self.node_label(n1) - self.node_label(n2)
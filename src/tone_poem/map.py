@@ -1,23 +1,42 @@
-from dataclasses import astuple
+import random
+from functools import partial
 from itertools import chain, combinations
 from math import floor
-from typing import Generator
+from typing import Callable
 
 import networkx as nx
 
 from . import voronoi
 from .poisson.poisson_disk import sample_poisson_uniform
+from .poisson.poisson_tiled import sample_poisson_tiled
 from .tools import (
     WINDOW_SIZE,
     Coords,
+    SegmentGrid,
     Size,
     WallCrossing,
     distance_squared,
     intersect,
+    sorted_pair,
 )
+from .voronoi_incremental import IncrementalVoronoi, VoronoiChange
 
 LONG_DISTANCE = 300
 
+# How many sets of points GraphMap tries before giving up, if the Voronoi
+# diagram of one comes out broken
+GENERATION_ATTEMPTS = 5
+
+# The steps of GraphMap generation, in order, as reported to on_phase
+MAP_PHASES = (
+    "poisson",
+    "delaunay",
+    "walls",
+    "multi_wall",
+    "crossings",
+    "pruning",
+)
+
 
 def constrain(
     *, given_point: Coords, slope: float, bounds: Size, rightward: bool = True
@@ -46,44 +65,138 @@ def constrain(
     return Coords(x0 + dx, y0 + dy)
 
 
-def _secondneighbors(graph, start) -> Generator[Coords, None, None]:
-    """Generate all nodes that are distance 2 from the given one.
+def _two_hop_index(graph: nx.Graph) -> dict[Coords, set[Coords]]:
+    """Map each node to the other nodes it shares a neighbor with.
 
-    (Note: this means it does not include nodes adjacent to the given one.)
+    These are the nodes two hops away, plus any adjacent nodes that also
+    share a neighbor with it (as in a triangle).
     """
-    immediate_neighbors = set(n for n in nx.all_neighbors(graph, start))
-    neighborhood = nx.ego_graph(graph, start, radius=2, center=False)
-    for n in neighborhood.nodes():
-        if n not in immediate_neighbors:
-            yield graph.nodes[n]
+    return {
+        node: {far for near in graph[node] for far in graph[near]} - {node}
+        for node in graph
+    }
+
+
+def prune_long_edges(graph: nx.Graph, max_distance_squared: float) -> None:
+    """Remove long edges from graph unless that would disconnect it.
+
+    This gives the same result as visiting the long edges in order and
+    removing each one that isn't a bridge at that point, but without a
+    connectivity check per edge. Short edges are never removed, so their
+    components can be merged up front; working backwards through the long
+    edges, an edge is then kept exactly when it joins two components that
+    the edges after it (and the short edges) don't already connect.
+    """
+    components = nx.utils.UnionFind(graph.nodes())
+    long_edges = []
+    for v1, v2 in graph.edges():
+        if distance_squared(v1, v2) > max_distance_squared:
+            long_edges.append((v1, v2))
+        else:
+            components.union(v1, v2)
+
+    redundant = []
+    for v1, v2 in reversed(long_edges):
+        if components[v1] == components[v2]:
+            redundant.append((v1, v2))
+        else:
+            components.union(v1, v2)
+    graph.remove_edges_from(redundant)
+
+
+def crosses_multiple_walls(edge, wall_index: SegmentGrid) -> bool:
+    """Check whether edge crosses more than one of the indexed walls."""
+    crossings = 0
+    for wall in wall_index.near(edge):
+        crossings += intersect(edge, wall)
+        if crossings > 1:
+            return True
+    return False
 
 
 class GraphMap:
     """A map with nodes connected by edges."""
 
     wall_dict: dict[Coords, tuple[Coords, Coords]]
+    # each node's Voronoi cell, clipped to dims, counter-clockwise
+    cells: dict[Coords, list[Coords]]
     dims: Size
     min_distance: float
     margin: int
     graph: nx.Graph
 
-    def __init__(self, margin: int = 60, dims: Size = WINDOW_SIZE):
+    def __init__(
+        self,
+        margin: int = 60,
+        dims: Size = WINDOW_SIZE,
+        min_distance: float | None = None,
+        on_phase: Callable[[str], None] | None = None,
+        voronoi_backend: str = "fortune",
+        poisson_backend: str = "python",
+        rng: random.Random | None = None,
+        poisson_processes: int | None = 1,
+    ):
+        """Generate a map of the given size.
+
+        min_distance is the minimum distance between nodes, by default
+        1/18th of the sum of the dimensions. If on_phase is given, it's called
+        with the name of each step of generation (one of MAP_PHASES) just
+        before that step starts. voronoi_backend is passed on to
+        voronoi.computeVoronoiContext, and poisson_backend to
+        sample_poisson_uniform; "numpy" is much faster for big maps in both.
+        The points are sampled with rng, or with the random module's
+        functions if it's None; either way the same seed gives the same map.
+        With poisson_processes other than 1, they're sampled in tiles on that
+        many processes (None for one per CPU) by sample_poisson_tiled, which
+        gives the same points whatever the number.
+
+        If the Voronoi diagram of the sampled points fails validation, new
+        points are sampled, and the phases start over; after
+        GENERATION_ATTEMPTS tries the VoronoiError is raised.
+        """
+        phase = on_phase or (lambda name: None)
         self.dims = dims
-        self.min_distance = sum(dims) / 18
+        self.min_distance = min_distance or sum(dims) / 18
         self.margin = margin
-        points = [
-            Coords(floor(x) + self.margin, floor(y) + self.margin)
-            for x, y in sample_poisson_uniform(
-                self.dims.w - self.margin * 2,
-                self.dims.h - self.margin * 2,
-                self.min_distance,
-                # Sample points for Poisson, arbitrary
-                30,
-            )
-        ]
+        sample = (
+            sample_poisson_uniform
+            if poisson_processes == 1
+            else partial(sample_poisson_tiled, processes=poisson_processes)
+        )
+
+        for attempt in range(GENERATION_ATTEMPTS):
+            phase("poisson")
+            points = [
+                Coords(floor(x) + self.margin, floor(y) + self.margin)
+                for x, y in sample(
+                    self.dims.w - self.margin * 2,
+                    self.dims.h - self.margin * 2,
+                    self.min_distance,
+                    # Sample points for Poisson, arbitrary
+                    30,
+                    poisson_backend,
+                    rng,
+                )
+            ]
+
+            phase("delaunay")
+            # one sweep gives us both the Delaunay edges and the Voronoi walls
+            try:
+                context = voronoi.computeVoronoiContext(
+                    points,
+                    voronoi_backend,
+                    strict=True,
+                    bounds=(0, 0, self.dims.w, self.dims.h),
+                )
+                break
+            except voronoi.VoronoiError:
+                # rng has moved on, so the next points will differ
+                if attempt == GENERATION_ATTEMPTS - 1:
+                    raise
+
         self.graph = nx.Graph()
         self.graph.add_nodes_from(points)
-        for triangle in voronoi.computeDelaunayTriangulation(points):
+        for triangle in context.triangles:
             self.graph.add_edges_from(
                 chain.from_iterable(
                     [
@@ -95,100 +208,96 @@ class GraphMap:
                     ]
                 )
             )
-        wall_crossings, self.wall_dict = self.computeWalls()
+
+        phase("walls")
+        wall_crossings, self.wall_dict, self.cells = self.computeWalls(
+            points, context
+        )
         self.walls = [cross.wall for cross in wall_crossings]
+
+        phase("multi_wall")
         self.removeMultiWallEdges()
 
         # add the wall crossing a given edge as an edge attribute
+        phase("crossings")
         self.addCrossings(wall_crossings)
 
         # make a copy of the graph including all edges between adjacent cells
         self.adjacency = self.graph.copy()
 
         # remove too-long edges unless doing so would disconnect the graph
-        dist_squared = self.min_distance**2
-        # can't use edges here since we're modifying it
-        for v1, v2, attrs in list(self.graph.edges(data=True)):
-            if distance_squared(v1, v2) > 2 * dist_squared:
-                self.graph.remove_edge(v1, v2)
-                if not nx.is_connected(self.graph):
-                    self.graph.add_edge(v1, v2, **attrs)
+        phase("pruning")
+        prune_long_edges(self.graph, 2 * self.min_distance**2)
 
     def removeMultiWallEdges(self):
-        for edge in self.graph.edges():
-            crossings = 0
-            for wall in self.walls:
-                if wall is None:
-                    continue
-                crossings += intersect(edge, wall)
-                if crossings > 1:
-                    self.graph.remove_edge(*edge)
-                    break
-
-    def pointOutsideBounds(self, x, y):
-        return any([x < 0, x > self.dims.w, y < 0, y > self.dims.h])
-
-    def addCrossings(self, wall_crossings):
-        print(len(self.graph.edges()))
-        count = 0
-        for wall, (node1, node2) in [
-            astuple(wall_crossing) for wall_crossing in wall_crossings
-        ]:
-            # add the wall corresponding to an edge as an edge attribute
-            # this doesn't seem to get all of them though
-            # at this point multi-wall edges still exist
-            if self.graph.has_edge(node1, node2):
-                self.graph[node1][node2]["wall"] = wall
-                print(node1, node2, wall)
-                count += 1
-        print(count)
+        """Remove edges that cross more than one wall.
 
-    def computeWalls(
-        self,
-    ) -> tuple[list[WallCrossing], dict[Coords, tuple[Coords, Coords]]]:
-        nodes = list(self.graph.nodes())
+        Walls are bucketed on a grid so each edge is only tested against
+        the walls near it.
+        """
+        wall_index = SegmentGrid(
+            [wall for wall in self.walls if wall is not None],
+            self.min_distance,
+        )
+        self.graph.remove_edges_from(
+            [
+                edge
+                for edge in self.graph.edges()
+                if crosses_multiple_walls(edge, wall_index)
+            ]
+        )
 
-        # Poached from voronoi.computeVoronoiDiagram
-        # http://stackoverflow.com/questions/9441007/how-can-i-get-a-dictionary-of-cells-from-this-voronoi-diagram-data
-        site_list = voronoi.SiteList(nodes)
-        context = voronoi.Context()
-        voronoi.voronoi(site_list, context)
-        verts = context.vertices
+    def addCrossings(self, wall_crossings: list[WallCrossing]):
+        """Set each edge's "wall" attribute to the wall it crosses.
 
-        walls: list[WallCrossing | None] = [None for _ in context.edges]
+        Every wall is the Voronoi edge between the two sites its path joins,
+        so this is a lookup per wall rather than a geometric search. Paths
+        whose edge has already been removed are skipped.
+        """
+        nx.set_edge_attributes(
+            self.graph,
+            {crossing.path: crossing.wall for crossing in wall_crossings},
+            "wall",
+        )
 
-        for i, v1, v2 in context.edges:
-            path: voronoi.Bisector = context.bisectors[i]
-            if all(
-                v != -1 and not self.pointOutsideBounds(*verts[v])
-                for v in (v1, v2)
-            ):
-                # edge has a vertex at either end, easy
+    def computeWalls(
+        self, nodes: list[Coords], context: voronoi.Context
+    ) -> tuple[
+        list[WallCrossing],
+        dict[Coords, tuple[Coords, Coords]],
+        dict[Coords, list[Coords]],
+    ]:
+        """Turn the Voronoi edges and cells of a sweep over nodes into walls.
+
+        context should be the result of sweeping exactly the given nodes,
+        in the same order, since sites are identified by index, with its
+        cells clipped to the map's bounds. Each wall is the side of a cell
+        that lies along the edge; edges outside the bounds have none.
+        """
+        # cells share their corners, so share the Coords too
+        corners = {}
+        for cell in context.cells.values():
+            for vertex in cell:
+                if vertex not in corners:
+                    corners[vertex] = Coords(*vertex)
+
+        sides = {}
+        for site, cell in context.cells.items():
+            for i, line in enumerate(context.cellLines[site]):
+                # the second site's cell runs along the edge from v1 to v2
+                if line != -1 and context.sitePairs[line][1] == site:
+                    sides[line] = (
+                        corners[cell[i]],
+                        corners[cell[(i + 1) % len(cell)]],
+                    )
+
+        walls: list[WallCrossing | None] = [None for _ in context.edges]
+        for i, _, _ in context.edges:
+            if i in sides:
+                site1, site2 = context.sitePairs[i]
                 walls[i] = WallCrossing(
-                    wall=(Coords(*verts[v1]), Coords(*verts[v2])),
-                    path=path,
-                )
-                continue
-            if self.pointOutsideBounds(*verts[v1]):
-                v1 = -1
-            elif self.pointOutsideBounds(*verts[v2]):
-                v2 = -1
-            # apparently v1, v2 go left to right
-            # calculate an edge point using slope = -a/b
-            a, b, _ = context.lines[i]
-            p0 = Coords(*verts[v1 if v1 != -1 else v2])
-            if self.pointOutsideBounds(*p0):
-                continue
-            # need to handle case where b is 0
-            p1 = Coords(
-                *constrain(
-                    given_point=p0,
-                    slope=(-a / b) if b else (-a * float("inf")),
-                    bounds=self.dims,
-                    rightward=(v1 != -1),
+                    wall=sides[i], path=(nodes[site1], nodes[site2])
                 )
-            )
-            walls[i] = WallCrossing((p0, p1), path)
 
         wall_dict = dict()
         for site, edge_list in context.polygons.items():
@@ -196,7 +305,116 @@ class GraphMap:
                 walls[i].wall for i, _, _ in edge_list if walls[i] is not None
             ]
 
-        return [wall for wall in walls if wall is not None], wall_dict
+        cells = {
+            nodes[site]: [corners[vertex] for vertex in cell]
+            for site, cell in context.cells.items()
+        }
+        return [wall for wall in walls if wall is not None], wall_dict, cells
+
+    def _editor(self) -> IncrementalVoronoi:
+        # set up by the first edit, since most maps are never edited
+        if "_voronoi" not in self.__dict__:
+            self._voronoi = IncrementalVoronoi(
+                list(self.adjacency.nodes()), (0, 0, self.dims.w, self.dims.h)
+            )
+        return self._voronoi
+
+    def insert_node(self, node: Coords) -> VoronoiChange:
+        """Add a node, updating only the cells, walls and edges around it.
+
+        The first edit sweeps the whole map to set up an IncrementalVoronoi;
+        after that each edit only sweeps the nodes near it. The new node is
+        left unlabeled. Returns what changed in the Voronoi diagram.
+        """
+        change = self._editor().insert(node)
+        self.graph.add_node(node)
+        self.adjacency.add_node(node)
+        self._apply_change(change, [])
+        return change
+
+    def remove_node(self, node: Coords) -> VoronoiChange:
+        """Remove a node, updating only the cells, walls and edges around it.
+
+        See insert_node.
+        """
+        change = self._editor().delete(node)
+        self.graph.remove_node(node)
+        self.adjacency.remove_node(node)
+        del self.cells[node]
+        self._apply_change(change, self.wall_dict.pop(node))
+        return change
+
+    def _apply_change(self, change: VoronoiChange, stale: list):
+        """Update the graphs, walls and cells to match an edit.
+
+        stale lists walls already gone along with a removed node. Edges are
+        worked out as in __init__, but only for nodes whose cells changed,
+        and long ones are pruned unless that disconnects their ends.
+        """
+        editor = self._editor()
+        changed = set(change.cells)
+        # every wall that changed is between two of these
+        nearby = changed.union(*(editor.neighbors[node] for node in changed))
+
+        stale = set(stale)
+        for node in nearby:
+            stale.update(self.wall_dict.get(node, []))
+            self.wall_dict[node] = [
+                (Coords(*wall[0]), Coords(*wall[1]))
+                for wall in (
+                    editor.walls.get(sorted_pair(node, neighbor))
+                    for neighbor in editor.neighbors[node]
+                )
+                if wall is not None
+            ]
+        for node in changed:
+            self.cells[node] = [
+                Coords(*vertex) for vertex in editor.cells[node]
+            ]
+        fresh = {wall for node in nearby for wall in self.wall_dict[node]}
+        self.walls = [
+            wall for wall in self.walls if wall not in stale or wall in fresh
+        ]
+        self.walls.extend(fresh - set(self.walls))
+
+        wall_index = SegmentGrid(list(fresh), self.min_distance)
+        long_edges = []
+        for node in changed:
+            for neighbor in set(self.adjacency[node]) - editor.neighbors[node]:
+                self.adjacency.remove_edge(node, neighbor)
+                if self.graph.has_edge(node, neighbor):
+                    self.graph.remove_edge(node, neighbor)
+            for neighbor in editor.neighbors[node]:
+                edge = (node, neighbor)
+                if crosses_multiple_walls(edge, wall_index):
+                    if self.adjacency.has_edge(*edge):
+                        self.adjacency.remove_edge(*edge)
+                    if self.graph.has_edge(*edge):
+                        self.graph.remove_edge(*edge)
+                    continue
+                wall = editor.walls.get(sorted_pair(*edge))
+                attrs = {}
+                if wall is not None:
+                    attrs["wall"] = (Coords(*wall[0]), Coords(*wall[1]))
+                for graph in (self.adjacency, self.graph):
+                    graph.add_edge(*edge)
+                    graph.edges[edge].pop("wall", None)
+                    graph.edges[edge].update(attrs)
+                if distance_squared(*edge) > 2 * self.min_distance**2:
+                    long_edges.append(sorted_pair(*edge))
+
+        for edge in sorted(set(long_edges)):
+            attrs = self.graph.edges[edge]
+            self.graph.remove_edge(*edge)
+            if not nx.has_path(self.graph, *edge):
+                self.graph.add_edge(*edge, **attrs)
+
+    def nodes(self):
+        return self.graph.nodes()
+
+    def edges(self, nbunch=None):
+        """Get the edges (of the pruned graph) from nbunch, or all of them."""
+        return self.graph.edges(nbunch)
 
     def connected_neighbors(self, node):
         """Get all neighbors of a node with an edge connecting them."""
@@ -206,14 +424,17 @@ class GraphMap:
         """Get all neighbors of a node even if there's no edge between them."""
         return self.adjacency.neighbors(node)
 
-    def _cleanup_nodes(self, nodeType):
+    def _cleanup_nodes(self, nodeType, rng=None):
         pass
 
-    def add_labels(self, nodeType):
+    def add_labels(self, nodeType, rng: random.Random | None = None):
+        """Label every node with a new nodeType, drawn with rng."""
         nx.set_node_attributes(
-            self.graph, {n: nodeType() for n in self.graph.nodes()}, "label"
+            self.graph,
+            {n: nodeType(rng=rng) for n in self.graph.nodes()},
+            "label",
         )
-        self._cleanup_nodes(nodeType)
+        self._cleanup_nodes(nodeType, rng)
 
     def edge_label(self, n1, n2):
         return self.node_label(n1) - self.node_label(n2)
@@ -224,6 +445,9 @@ class GraphMap:
     def walls_for_node(self, n):
         return self.wall_dict[n]
 
+    def cell_for_node(self, n):
+        return self.cells[n]
+
     def wall_between_nodes(self, n1, n2):
         return self.adjacency[n1][n2]["wall"]
 
@@ -235,26 +459,28 @@ class GraphMap:
 
 
 class ForestMap(GraphMap):
-    def _cleanup_nodes(self, nodeType):
+    def _cleanup_nodes(self, nodeType, rng=None):
         """Avoid ambiguous edges from any node.
 
         This means satisfying the following constraint:
         No node may have more than one adjacent node with the same value.
         """
-        for center in nx.nodes(self.graph):
+        labels = nx.get_node_attributes(self.graph, "label")
+        two_hops = _two_hop_index(self.graph)
+        for center in self.graph:
             seen = set()
-            for neighbor in nx.all_neighbors(self.graph, center):
-                node = self.graph.nodes[neighbor]
-                if node["label"].name in seen:
-                    illegal = set(
-                        n["label"].name
-                        for n in _secondneighbors(self.graph, neighbor)
-                    )
-                    # Not a fan of reaching in and using to_shorthand here, but...
-                    node["label"].value = [
+            for neighbor in self.graph[center]:
+                label = labels[neighbor]
+                if label.pitch_class in seen:
+                    illegal = {
+                        labels[n].pitch_class for n in two_hops[neighbor]
+                    }
+                    choices = [
                         c
                         for c in nodeType.POSSIBLE_VALUES
-                        if c.to_shorthand() not in illegal
+                        if int(c) % 12 not in illegal
                     ]
-                else:
-                    seen.add(node["label"].name)
+                    # Every pitch class is already taken; nothing to do.
+                    if choices:
+                        label.pick(choices, rng)
+                seen.add(label.pitch_class)
@@ -0,0 +1,73 @@
+"""Build maps on a worker thread, so the UI stays responsive meanwhile.
+
+The builder knows nothing about Kivy: its callbacks are called on the worker
+thread, and it's up to the caller to pass results back to its own thread
+(AreaScreen uses Clock.schedule_once for that).
+"""
+
+import threading
+from typing import Callable, Generic, TypeVar
+
+from .map import MAP_PHASES
+
+# Phases reported while building a labeled map: the ones from GraphMap, then
+# labeling the nodes.
+BUILD_PHASES = MAP_PHASES + ("labels",)
+
+Built = TypeVar("Built")
+
+
+class MapBuilder(Generic[Built]):
+    """Run build(on_phase) on a daemon thread.
+
+    on_progress is called with (phase name, phase index, phase count) each
+    time build reports a phase, then exactly one of on_done (with the built
+    map) or on_error (with the exception) is called. build usually returns
+    a GraphMap, but can return any part of one, like the chunk records of a
+    TiledForestMap.
+    """
+
+    def __init__(
+        self,
+        build: Callable[[Callable[[str], None]], Built],
+        *,
+        on_progress: Callable[[str, int, int], None] | None = None,
+        on_done: Callable[[Built], None] | None = None,
+        on_error: Callable[[Exception], None] | None = None,
+        phases: tuple[str, ...] = BUILD_PHASES,
+    ):
+        self.build = build
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.on_error = on_error
+        self.phases = phases
+        self.result: Built | None = None
+        self.error: Exception | None = None
+        self._thread = threading.Thread(
+            target=self._run, name="map builder", daemon=True
+        )
+
+    def start(self) -> "MapBuilder[Built]":
+        self._thread.start()
+        return self
+
+    def join(self, timeout: float | None = None) -> bool:
+        """Wait for the build to finish, returning whether it did."""
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _report(self, name: str):
+        if self.on_progress:
+            index = self.phases.index(name) if name in self.phases else -1
+            self.on_progress(name, index, len(self.phases))
+
+    def _run(self):
+        try:
+            self.result = self.build(self._report)
+        except Exception as e:
+            self.error = e
+            if self.on_error:
+                self.on_error(e)
+            return
+        if self.on_done:
+            self.on_done(self.result)
@@ -0,0 +1,208 @@
+"""On-disk cache of generated maps.
+
+Maps are stored as JSON, keyed by everything that determines their contents:
+the random seed, the generation parameters and a hash of the code that
+generates them, so editing any of that code invalidates old entries.
+"""
+
+import hashlib
+import json
+import os
+import random
+from pathlib import Path
+from typing import Callable
+
+import networkx as nx
+
+from .map import GraphMap
+from .map_label import NamedLabel
+from .tools import ROOT_DIR, WINDOW_SIZE, Coords, Size
+
+# Bump this when the serialized layout below changes.
+MAP_CACHE_FORMAT = 2
+
+# Modules whose code decides what a generated map looks like.
+GENERATOR_SOURCES = (
+    "map.py",
+    "map_label.py",
+    "tools.py",
+    "voronoi.py",
+    os.path.join("poisson", "datastructures.py"),
+    os.path.join("poisson", "enhanced_grid.py"),
+    os.path.join("poisson", "poisson_disk.py"),
+)
+
+
+def code_version() -> str:
+    """Hash the source of the map generator."""
+    digest = hashlib.sha1()
+    for source in GENERATOR_SOURCES:
+        digest.update(Path(ROOT_DIR, source).read_bytes())
+    return digest.hexdigest()
+
+
+def cache_key(
+    *,
+    map_type: type[GraphMap],
+    seed: int,
+    dims: Size,
+    margin: int,
+    min_distance: float | None,
+) -> str:
+    key = json.dumps(
+        [
+            MAP_CACHE_FORMAT,
+            code_version(),
+            map_type.__name__,
+            seed,
+            list(dims),
+            margin,
+            min_distance,
+        ]
+    )
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def _wall_to_json(wall):
+    if wall is None:
+        return None
+    (x1, y1), (x2, y2) = wall
+    return [x1, y1, x2, y2]
+
+
+def _wall_from_json(wall):
+    if wall is None:
+        return None
+    x1, y1, x2, y2 = wall
+    return (Coords(x1, y1), Coords(x2, y2))
+
+
+def dump_map(graph_map: GraphMap) -> dict:
+    """Convert a map to a JSON-serializable dict."""
+    nodes = list(graph_map.adjacency.nodes())
+    index = {node: i for i, node in enumerate(nodes)}
+    data = {
+        "format": MAP_CACHE_FORMAT,
+        "dims": list(graph_map.dims),
+        "margin": graph_map.margin,
+        "min_distance": graph_map.min_distance,
+        "nodes": [list(node) for node in nodes],
+        "adjacency": [
+            [index[n1], index[n2], _wall_to_json(attrs.get("wall"))]
+            for n1, n2, attrs in graph_map.adjacency.edges(data=True)
+        ],
+        "edges": [[index[n1], index[n2]] for n1, n2 in graph_map.graph.edges()],
+        "walls": [_wall_to_json(wall) for wall in graph_map.walls],
+        "wall_dict": [
+            [index[node], [_wall_to_json(wall) for wall in walls]]
+            for node, walls in graph_map.wall_dict.items()
+        ],
+        "cells": [
+            [index[node], [list(corner) for corner in cell]]
+            for node, cell in graph_map.cells.items()
+        ],
+    }
+    labels = nx.get_node_attributes(graph_map.graph, "label")
+    if labels:
+        data["labels"] = [str(labels[node]) for node in nodes]
+    return data
+
+
+def load_map(
+    data: dict, map_type: type[GraphMap], nodeType: type[NamedLabel]
+) -> GraphMap:
+    """Rebuild a map from the output of dump_map, without regenerating it."""
+    if data["format"] != MAP_CACHE_FORMAT:
+        raise ValueError(f"Unknown map cache format {data['format']}")
+    graph_map = map_type.__new__(map_type)
+    graph_map.dims = Size(*data["dims"])
+    graph_map.margin = data["margin"]
+    graph_map.min_distance = data["min_distance"]
+
+    nodes = [Coords(x, y) for x, y in data["nodes"]]
+    graph_map.adjacency = nx.Graph()
+    graph_map.adjacency.add_nodes_from(nodes)
+    for i, j, wall in data["adjacency"]:
+        if wall is None:
+            graph_map.adjacency.add_edge(nodes[i], nodes[j])
+        else:
+            graph_map.adjacency.add_edge(
+                nodes[i], nodes[j], wall=_wall_from_json(wall)
+            )
+
+    graph_map.graph = nx.Graph()
+    graph_map.graph.add_nodes_from(nodes)
+    graph_map.graph.add_edges_from(
+        (nodes[i], nodes[j], graph_map.adjacency[nodes[i]][nodes[j]])
+        for i, j in data["edges"]
+    )
+    if "labels" in data:
+        nx.set_node_attributes(
+            graph_map.graph,
+            {
+                node: nodeType.from_name(name)
+                for node, name in zip(nodes, data["labels"])
+            },
+            "label",
+        )
+
+    graph_map.walls = [_wall_from_json(wall) for wall in data["walls"]]
+    graph_map.wall_dict = {
+        nodes[i]: [_wall_from_json(wall) for wall in walls]
+        for i, walls in data["wall_dict"]
+    }
+    graph_map.cells = {
+        nodes[i]: [Coords(x, y) for x, y in cell] for i, cell in data["cells"]
+    }
+    return graph_map
+
+
+def load_or_generate(
+    cache_dir: str,
+    *,
+    map_type: type[GraphMap],
+    nodeType: type[NamedLabel],
+    seed: int,
+    margin: int = 60,
+    dims: Size = WINDOW_SIZE,
+    min_distance: float | None = None,
+    on_phase: Callable[[str], None] | None = None,
+) -> GraphMap:
+    """Load a labeled map from cache_dir, generating and caching it if needed.
+
+    A missing or unreadable cache file is regenerated and overwritten.
+    on_phase is passed on to the map, and also called with "labels" before
+    labeling it; a map loaded from the cache reports no phases.
+    """
+    key = cache_key(
+        map_type=map_type,
+        seed=seed,
+        dims=dims,
+        margin=margin,
+        min_distance=min_distance,
+    )
+    path = Path(cache_dir, f"{key}.json")
+    try:
+        with open(path) as cache_file:
+            return load_map(json.load(cache_file), map_type, nodeType)
+    except (OSError, ValueError, KeyError):
+        pass
+
+    rng = random.Random(seed)
+    graph_map = map_type(
+        margin=margin,
+        dims=dims,
+        min_distance=min_distance,
+        on_phase=on_phase,
+        rng=rng,
+    )
+    if on_phase:
+        on_phase("labels")
+    graph_map.add_labels(nodeType, rng)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    partial_path = path.with_suffix(".tmp")
+    with open(partial_path, "w") as cache_file:
+        json.dump(dump_map(graph_map), cache_file)
+    os.replace(partial_path, path)
+    return graph_map
@@ -1,4 +1,5 @@
-from random import choice
+import random
+from typing import Protocol
 
 from mingus.containers import Note, NoteContainer
 from mingus.core.intervals import determine
@@ -10,6 +11,15 @@ class NodeLabel(object):
     pass
 
 
+class NamedLabel(Protocol):
+    """A node label type whose labels can be stored as their str(), like
+    NodeNote, and read back with from_name.
+    """
+
+    @classmethod
+    def from_name(cls, name: str) -> "NamedLabel": ...
+
+
 class NodeNote(NodeLabel):
     POSSIBLE_VALUES = [Note(n, 4) for n in NOTE_NAMES]
 
@@ -19,18 +29,37 @@ class NodeNote(NodeLabel):
 
     @value.setter
     def value(self, note_choices):
-        self._container = NoteContainer(choice(note_choices))
+        self.pick(note_choices)
+
+    def pick(self, note_choices, rng=None):
+        """Set the value to one of note_choices, chosen with rng.
+
+        rng is a random.Random; by default the random module's choice is
+        used.
+        """
+        self._container = NoteContainer((rng or random).choice(note_choices))
 
     @property
     def name(self):
         return fancify_note_name(self.value.to_shorthand())
 
-    def __init__(self, note=None):
+    @property
+    def pitch_class(self) -> int:
+        """The note's pitch class, from 0 for C to 11 for B."""
+        return int(self.value) % 12
+
+    def __init__(self, note=None, rng=None):
         self._container = None
-        self.value = (
-            [note] if note else [Note(n, 4) for n in NOTE_NAMES if len(n) == 1]
+        self.pick(
+            [note] if note else [Note(n, 4) for n in NOTE_NAMES if len(n) == 1],
+            rng,
         )
 
+    @classmethod
+    def from_name(cls, name):
+        """Recreate a label from its str()."""
+        return cls(Note(name, 4))
+
     def __sub__(self, other):
         is_up = self.value <= other.value
         if is_up:
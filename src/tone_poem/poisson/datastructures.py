@@ -5,7 +5,8 @@
 #These are used to implement algorithms cleanly.
 """
 
-from random import randint
+import random
+from math import frexp, ldexp
 
 
 ##@brief A class that works just like a queue or a stack, except
@@ -21,11 +22,24 @@ from random import randint
 #   for i in range(3):
 #     rqueue.push(process(rqueue.pop()))
 # @endcode
+#
+# Popping moves the last element into the popped one's place, so it takes
+# constant time. Elements are kept in a plain list: the samplers' points
+# are tuples in their grids and results anyway, so a list only adds a
+# reference to each, and pop hands back the element itself.
 class RandomQueue:
-    ## Constructs a new empty RandomQueue
-    def __init__(self):
+    ## Constructs a new empty RandomQueue, which picks elements with rng
+    ## (a random.Random), or with the random module's functions if that's
+    ## None.
+    def __init__(self, rng=None):
         ## The internal list to store objects.
         self.array = []
+        ## Where random numbers come from.
+        self.rng = rng or random
+
+    ## Returns the number of elements in this RandomQueue.
+    def __len__(self):
+        return len(self.array)
 
     ##Returns True if this RandomQueue is empty.
     def empty(self):
@@ -35,19 +49,130 @@ class RandomQueue:
     def push(self, x):
         self.array.append(x)
 
+    ## Push each of the given elements into the RandomQueue, in order.
+    def extend(self, xs):
+        self.array.extend(xs)
+
     ## @brief Pops a randomly selected element from the queue.
     ##
     # All elements can be selected equiprobably
     def pop(self):
-        n = len(self.array)
+        array = self.array
+        n = len(array)
 
         if n <= 0:
             raise IndexError("Cannot pop from emty container!")
-        elif n == 1:
-            return self.array.pop()
+        last = array.pop()
+        if n == 1:
+            return last
+        i = self.rng.randint(0, n - 1)
+        if i == n - 1:
+            return last
+        element = array[i]
+        array[i] = last
+        return element
+
+
+##@brief A fixed-size 2D grid stored in one flat list.
+##
+# Unlike enhanced_grid.Grid2D there is no slicing: cells are read and
+# written by flat index, which makes it cheap enough for the inner loops
+# of the samplers. The grid is surrounded by a border of padding cells
+# holding initial_item, so that the square of cells around any cell of the
+# grid can be visited through square_offsets without bounds checks:
+# @code
+# i = grid.index(x, y)
+# for offset in grid.square_offsets:
+#     process(grid.cells[i + offset])
+# @endcode
+class FlatGrid:
+    ## Constructs a width by height grid with every cell set to initial_item
+    def __init__(self, dims, padding, initial_item=None):
+        width, height = dims
+        self.width = width
+        self.height = height
+        self.padding = padding
+        ## The distance between vertically adjacent cells in cells.
+        self.stride = width + 2 * padding
+        ## All the cells, row by row, border included.
+        self.cells = [initial_item] * (self.stride * (height + 2 * padding))
+        ## The offsets from a cell's index to the indices of the cells in
+        ## the square of side 2 * padding + 1 around it.
+        self.square_offsets = tuple(
+            dy * self.stride + dx
+            for dy in range(-padding, padding + 1)
+            for dx in range(-padding, padding + 1)
+        )
+
+    ## Returns the index in cells of the cell at x, y.
+    def index(self, x, y):
+        return (y + self.padding) * self.stride + x + self.padding
+
+
+## The cells within n of (0, 0), for each n a RadiusGrid query can need,
+## nearest first.
+SQUARE_OFFSETS = {
+    n: sorted(
+        ((i, j) for i in range(-n, n + 1) for j in range(-n, n + 1)),
+        key=lambda offset: offset[0] ** 2 + offset[1] ** 2,
+    )
+    for n in (1, 2)
+}
+
+
+##@brief A spatial index of points that each have their own radius.
+##
+# It answers whether any point is within min(r, its own radius) of a
+# location with radius r. Points are kept in levels by radius, level l
+# holding the points with radii in [2**l, 2**(l + 1)), and each level is a
+# sparse grid with cells 2**l on a side. So however much the radii vary,
+# a query only looks at the few cells around the location in each level:
+# points of big radius aren't found through a fine grid, nor points of
+# small radius through a coarse one.
+class RadiusGrid:
+    ## Constructs an empty RadiusGrid
+    def __init__(self):
+        ## Level number -> (cell size, dict of cell -> list of (x, y, r)).
+        self.levels = {}
+        ## Level number -> the levels' values, nearest level first, since
+        ## that's where a location's neighbors usually are.
+        self.search_order = {}
+
+    ## Adds a point at x, y with radius r (which must be positive).
+    def add(self, x, y, r):
+        if not r > 0:
+            raise ValueError(f"radius must be positive, not {r}")
+        level = frexp(r)[1] - 1
+        if level not in self.levels:
+            self.levels[level] = (ldexp(1.0, level), {})
+            self.search_order = {}
+        size, cells = self.levels[level]
+        cell = (int(x // size), int(y // size))
+        if cell in cells:
+            cells[cell].append((x, y, r))
         else:
-            i = randint(0, n - 1)
-            j = n - 1
-            self.array[i], self.array[j] = self.array[j], self.array[i]
+            cells[cell] = [(x, y, r)]
 
-        return self.array.pop()
+    ## @brief Returns True if some point is no further from x, y than
+    ## the smaller of r and the point's own radius.
+    def crowds(self, x, y, r):
+        level = frexp(r)[1] - 1
+        if level not in self.search_order:
+            self.search_order[level] = [
+                self.levels[other]
+                for other in sorted(
+                    self.levels, key=lambda other: abs(other - level)
+                )
+            ]
+        for size, cells in self.search_order[level]:
+            # the level's radii are all under 2 * size
+            cx = int(x // size)
+            cy = int(y // size)
+            for i, j in SQUARE_OFFSETS[1 if r <= size else 2]:
+                points = cells.get((cx + i, cy + j))
+                if points:
+                    for px, py, pr in points:
+                        limit = r if r < pr else pr
+                        if (px - x) ** 2 + (py - y) ** 2 <= limit * limit:
+                            return True
+        return False
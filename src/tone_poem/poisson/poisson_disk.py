@@ -14,16 +14,43 @@
 ##@brief Contains functions for generating Poisson disk samples.
 ##
 
+import random
 from math import ceil, cos, pi, sin, sqrt
-from random import randint, uniform
 
-from .datastructures import RandomQueue
-from .enhanced_grid import Grid2D, ListGrid2D, int_point_2d
+from .datastructures import FlatGrid, RadiusGrid, RandomQueue
 
+## The ways sample_poisson_uniform can sample: "python" for the loop in this
+## module, "table" for the same loop drawing candidates from ANNULUS_TABLE,
+## or "numpy" for the batched one in poisson_numpy.
+BACKENDS = ("python", "table", "numpy")
 
-##@brief Returns a random integer in the range [0, n-1] inclusive.
-def rand(n):
-    return randint(0, n - 1)
+## How many offsets ANNULUS_TABLE holds.
+ANNULUS_TABLE_SIZE = 4096
+
+
+##@brief Offsets from a point to candidates around it, for r = 1.
+##
+# They're drawn like generate_random_around's, between 1 and 2 units away
+# at a uniformly random angle. Each point takes k consecutive offsets from
+# a random place in the table, turned by a random angle, so candidates
+# cost no calls to sin and cos and only two random numbers per point.
+def make_annulus_table(size=ANNULUS_TABLE_SIZE):
+    rng = random.Random(0)
+    table = []
+    for i in range(size):
+        rr = rng.uniform(1, 2)
+        rt = rng.uniform(0, 2 * pi)
+        table.append((rr * sin(rt), rr * cos(rt)))
+    return table
+
+
+ANNULUS_TABLE = make_annulus_table()
+
+
+##@brief Returns a random integer in the range [0, n-1] inclusive,
+## drawn with rng (a random.Random, or the random module itself).
+def rand(n, rng=random):
+    return rng.randint(0, n - 1)
 
 
 ##@brief The square of the distance between the given points
@@ -49,22 +76,70 @@ def sqr_dist(p0, p1):
 #        to other points. Typically, k = 30 is sufficient. The larger
 #        k is, the slower th algorithm, but the more sample points
 #        are produced.
+# @param backend
+#        One of BACKENDS. "table" is about a quarter faster than "python",
+#        and "numpy", which tests all k candidates around a point at once,
+#        several times faster.
+# @param rng
+#        The random.Random to draw from. By default the random module's
+#        own functions are used, so seeding random seeds the sample.
 # @return A list of tuples representing x, y coordinates of
 #        of the sample points. The coordinates are not necesarily
 #        integers, so that the can be more accurately scaled to be
 #        used on larger rectangles.
-def sample_poisson_uniform(width, height, r, k):
-    # Convert rectangle (the one to be sampled) coordinates to
-    # coordinates in the grid.
-    def grid_coordinates(p):
+def sample_poisson_uniform(width, height, r, k, backend="python", rng=None):
+    rng = rng or random
+    if backend == "numpy":
+        from . import poisson_numpy
+
+        return poisson_numpy.sample_poisson_uniform(width, height, r, k, rng)
+    if backend not in ("python", "table"):
+        raise ValueError(f"unknown Poisson backend {backend!r}")
+
+    # generate the first point
+    first = (rand(width, rng), rand(height, rng))
+    return fill_poisson_uniform(
+        width, height, r, k, [first], [first], rng, backend == "table"
+    )
+
+
+## @brief Adds points to a Poisson sample of a rectangle until no more fit
+## around the given ones.
+##
+# This is the loop of sample_poisson_uniform, starting from any points
+# instead of a single random one.
+#
+# @param width, height, r, k
+#        As for sample_poisson_uniform.
+# @param sample_points
+#        A list of points in the rectangle, all more than r apart. New
+#        points are appended to it.
+# @param active
+#        The points of sample_points to generate new points around.
+#        Points generated around them are in turn generated around.
+# @param rng
+#        The random.Random to draw from, by default the random module's
+#        own functions.
+# @param table
+#        Whether to draw candidates from ANNULUS_TABLE.
+# @return sample_points
+def fill_poisson_uniform(
+    width, height, r, k, sample_points, active, rng=None, table=False
+):
+    rng = rng or random
+    uniform = rng.uniform
+
+    # The index in the grid of the cell holding the given
+    # rectangle (the one to be sampled) coordinates.
+    def grid_index(p):
         x, y = p
-        return (int(x * inv_cell_size), int(y * inv_cell_size))
+        return grid.index(int(x * inv_cell_size), int(y * inv_cell_size))
 
     # Puts a sample point in all the algorithm's relevant containers.
     def put_point(p):
         process_list.push(p)
         sample_points.append(p)
-        grid[grid_coordinates(p)] = p
+        cells[grid_index(p)] = p
 
     # Generates a point randomly selected around
     # the given point, between r and 2*r units away.
@@ -81,13 +156,15 @@ def sample_poisson_uniform(width, height, r, k):
         return 0 <= x < width and 0 <= y < height
 
     def in_neighbourhood(p):
-        gp = gx, gy = grid_coordinates(p)
+        i = grid_index(p)
 
-        if grid[gp]:
+        if cells[i]:
             return True
 
-        for cell in grid.square_iter(gp, 2):
-            if cell and sqr_dist(cell, p) <= r_sqr:
+        x, y = p
+        for offset in square_offsets:
+            q = cells[i + offset]
+            if q and (q[0] - x) ** 2 + (q[1] - y) ** 2 <= r_sqr:
                 return True
         return False
 
@@ -96,18 +173,40 @@ def sample_poisson_uniform(width, height, r, k):
     inv_cell_size = 1 / cell_size
     r_sqr = r * r
 
-    grid = Grid2D((int(ceil(width / cell_size)), int(ceil(height / cell_size))))
+    # Points closer than r can be at most two cells apart, so that's all
+    # the padding in_neighbourhood needs.
+    grid = FlatGrid(
+        (int(ceil(width / cell_size)), int(ceil(height / cell_size))), 2
+    )
+    cells = grid.cells
+    square_offsets = grid.square_offsets
+    for p in sample_points:
+        cells[grid_index(p)] = p
 
-    process_list = RandomQueue()
-    sample_points = []
-
-    # generate the first point
-    put_point((rand(width), rand(height)))
+    process_list = RandomQueue(rng)
+    process_list.extend(active)
 
     # generate other points from points in queue.
     while not process_list.empty():
         p = process_list.pop()
 
+        if table:
+            x, y = p
+            turn = uniform(0, 2 * pi)
+            c, s = r * cos(turn), r * sin(turn)
+            start = rng.randrange(ANNULUS_TABLE_SIZE)
+            offsets = ANNULUS_TABLE[start : start + k]
+            if len(offsets) < k:
+                offsets += ANNULUS_TABLE[: k - len(offsets)]
+            for dx, dy in offsets:
+                qx = x + c * dx - s * dy
+                qy = y + s * dx + c * dy
+                if 0 <= qx < width and 0 <= qy < height:
+                    q = (qx, qy)
+                    if not in_neighbourhood(q):
+                        put_point(q)
+            continue
+
         for i in range(k):
             q = generate_random_around(p, r)
             if in_rectangle(q) and not in_neighbourhood(q):
@@ -118,35 +217,55 @@ def sample_poisson_uniform(width, height, r, k):
 
 ##@brief Gives a Poisson sample of points of a rectangle with an arbitrary distance function between points.
 ##
+# Each point gets the minimum distance r at its location, and no two
+# points are closer than the smaller of their two distances. So a dense
+# area is packed as tightly as its own r allows right up to the edge of a
+# sparse one, and sparse points keep their larger distance from each
+# other.
+#
 # @param width
 #        The width of the rectangle to sample
 # @param height
 #        The height of the rectangle to sample
-# @param r_grid
-#        r_grid[x, y] is the mimum distance between points around x, y, in terms of
-#        rectangle units.
+# @param r
+#        The mimum distance between points around x, y, in terms of
+#        rectangle units: either a function r(x, y), or anything that
+#        can be indexed as r[x, y] with integer x and y, like a Grid2D or
+#        a NumPy array of shape (ceil(width), ceil(height)).
 # @param k
 #        The algorithm generates k points around points already
 #        in the sample, and then check if they are not too close
 #        to other points. Typically, k = 30 is sufficient. The larger
 #        k is, the slower th algorithm, but the more sample points
 #        are produced.
+# @param rng
+#        The random.Random to draw from, by default the random module's
+#        own functions.
 # @return A list of tuples representing x, y coordinates of
 #        of the sample points. The coordinates are not necesarily
 #        integers, so that the can be more accurately scaled to be
 #        used on larger rectangles.
-def sample_poisson(width, height, r_grid, k):
-    # Convert rectangle (the one to be sampled) coordinates to
-    # coordinates in the grid.
-    def grid_coordinates(p):
-        x, y = p
-        return (int(x * inv_cell_size), int(y * inv_cell_size))
+def sample_poisson(width, height, r, k, rng=None):
+    rng = rng or random
+    uniform = rng.uniform
+
+    # The minimum distance at the given point.
+    if callable(r):
+
+        def radius(p):
+            return r(*p)
+
+    else:
+
+        def radius(p):
+            x, y = p
+            return float(r[int(x), int(y)])
 
     # Puts a sample point in all the algorithm's relevant containers.
-    def put_point(p):
-        process_list.push(p)
+    def put_point(p, rp):
+        process_list.push((p, rp))
         sample_points.append(p)
-        grid[grid_coordinates(p)].append(p)
+        grid.add(*p, rp)
 
     # Generates a point randomly selected around
     # the given point, between r and 2*r units away.
@@ -162,41 +281,23 @@ def sample_poisson(width, height, r_grid, k):
         x, y = p
         return 0 <= x < width and 0 <= y < height
 
-    def in_neighbourhood(p, r):
-        gp = grid_coordinates(p)
-        r_sqr = r * r
-
-        for cell in grid.square_iter(gp, 2):
-            for q in cell:
-                if sqr_dist(q, p) <= r_sqr:
-                    return True
-        return False
-
-    r_min, r_max = r_grid.min_max()
-
-    # Create the grid
-    cell_size = r_max / sqrt(2)
-    inv_cell_size = 1 / cell_size
-    r_max_sqr = r_max * r_max
-
-    grid = ListGrid2D(
-        int_point_2d((ceil(width / cell_size), ceil(height / cell_size)))
-    )
-
-    process_list = RandomQueue()
+    grid = RadiusGrid()
+    process_list = RandomQueue(rng)
     sample_points = []
 
     # generate the first point
-    put_point((rand(width), rand(height)))
+    first = (rand(width, rng), rand(height, rng))
+    put_point(first, radius(first))
 
     # generate other points from points in queue.
     while not process_list.empty():
-        p = process_list.pop()
-        r = r_grid[int_point_2d(p)]
+        p, rp = process_list.pop()
 
         for i in range(k):
-            q = generate_random_around(p, r)
-            if in_rectangle(q) and not in_neighbourhood(q, r):
-                put_point(q)
+            q = generate_random_around(p, rp)
+            if in_rectangle(q):
+                rq = radius(q)
+                if not grid.crowds(*q, rq):
+                    put_point(q, rq)
 
     return sample_points
@@ -0,0 +1,107 @@
+"""A NumPy version of poisson_disk.sample_poisson_uniform.
+
+It runs the same algorithm (Bridson's), but handles the k candidates around
+each point as one batch. The grid is a pair of padded arrays holding the
+coordinates of the point in each cell (NaN where there's none), so looking up
+the 5x5 block of cells around every candidate, and comparing each candidate
+with every point there, is a few array operations. The few candidates that
+survive are then checked against each other, in order, so the result is just
+as if they had been tried one at a time.
+
+Random numbers come from a NumPy generator seeded from the caller's
+random.Random (or the random module), so the result is just as repeatable as
+the Python version's.
+
+Use it through poisson_disk's backend="numpy" parameter.
+"""
+
+import random
+from math import ceil, pi, sqrt
+
+import numpy as np
+
+# the grid cells a point's neighbors can be in, relative to its own
+OFFSET_Y, OFFSET_X = (offsets.ravel() for offsets in np.mgrid[-2:3, -2:3])
+
+# Cells around the edge of the grid that are always empty, so the block
+# around any cell in the rectangle stays inside the arrays.
+PADDING = 2
+
+# Candidates are drawn for this many points at a time.
+CANDIDATE_BATCH = 256
+
+
+def sample_poisson_uniform(width, height, r, k, rng=None):
+    """Sample points of the width by height rectangle at least r apart.
+
+    Returns a list of (x, y) tuples, like poisson_disk.sample_poisson_uniform.
+    The NumPy generator is seeded from rng, a random.Random, or from the
+    random module if that's None.
+    """
+    rng = np.random.default_rng((rng or random).getrandbits(64))
+    cell_size = r / sqrt(2)
+    inv_cell_size = 1 / cell_size
+    r_sqr = r * r
+    columns = ceil(width / cell_size) + 2 * PADDING
+    rows = ceil(height / cell_size) + 2 * PADDING
+    grid_x = np.full(rows * columns, np.nan)
+    grid_y = np.full(rows * columns, np.nan)
+    block = OFFSET_Y * columns + OFFSET_X
+
+    sample_points = []
+    process_list = []
+
+    def put_point(x, y):
+        cell = (int(y * inv_cell_size) + PADDING) * columns + (
+            int(x * inv_cell_size) + PADDING
+        )
+        grid_x[cell] = x
+        grid_y[cell] = y
+        process_list.append(len(sample_points))
+        sample_points.append((x, y))
+
+    put_point(rng.uniform(0, width), rng.uniform(0, height))
+
+    batch = CANDIDATE_BATCH
+    while process_list:
+        # pop a random point, as RandomQueue does
+        i = int(rng.integers(len(process_list)))
+        process_list[i], process_list[-1] = process_list[-1], process_list[i]
+        px, py = sample_points[process_list.pop()]
+
+        if batch == CANDIDATE_BATCH:
+            radii = rng.uniform(r, 2 * r, (CANDIDATE_BATCH, k))
+            angles = rng.uniform(0, 2 * pi, (CANDIDATE_BATCH, k))
+            offsets_x = radii * np.sin(angles)
+            offsets_y = radii * np.cos(angles)
+            batch = 0
+        xs = offsets_x[batch] + px
+        ys = offsets_y[batch] + py
+        batch += 1
+        inside = (0 <= xs) & (xs < width) & (0 <= ys) & (ys < height)
+        xs, ys = xs[inside], ys[inside]
+        if not len(xs):
+            continue
+
+        cells = (
+            ((ys * inv_cell_size).astype(np.intp) + PADDING) * columns
+            + (xs * inv_cell_size).astype(np.intp)
+            + PADDING
+        )
+        around = cells[:, None] + block
+        dx = grid_x[around] - xs[:, None]
+        dy = grid_y[around] - ys[:, None]
+        # NaN (empty cells) compares false, so only real points count
+        free = ~((dx * dx + dy * dy) <= r_sqr).any(axis=1)
+        xs, ys = xs[free].tolist(), ys[free].tolist()
+
+        accepted = []
+        for x, y in zip(xs, ys):
+            if all(
+                (x - ax) * (x - ax) + (y - ay) * (y - ay) > r_sqr
+                for ax, ay in accepted
+            ):
+                accepted.append((x, y))
+                put_point(x, y)
+
+    return sample_points
@@ -0,0 +1,116 @@
+"""Uniform Poisson disk sampling of big rectangles on several processes.
+
+The rectangle is cut into tiles, and each tile is sampled on its own in a
+process pool. Tiles are sampled inset by half the minimum distance from the
+seams between them (but not from the rectangle's own edges), like chunks of a
+TiledForestMap, so points of neighboring tiles are always far enough apart.
+
+That leaves an empty strip along every seam. A final serial pass fills the
+strips in: it carries on the Bridson loop over the whole rectangle, from just
+the points close enough to a seam to put new points in a strip. The result is
+a sample of the whole rectangle with the same minimum distance guarantee as
+sample_poisson_uniform, in about the time it takes to sample one tile plus
+the strips.
+
+Each tile's random numbers come from its own random.Random, seeded from the
+caller's rng in tile order, so the sample doesn't depend on how many
+processes there are.
+"""
+
+import random
+from concurrent.futures import ProcessPoolExecutor
+from math import ceil
+
+from .poisson_disk import fill_poisson_uniform, sample_poisson_uniform
+
+# Tiles narrower than this many minimum distances would be mostly seam.
+MIN_TILE_SIZE = 8
+
+# The default size of tiles, in minimum distances: a 2000x1500 rectangle
+# sampled with r=20 is cut into 12 tiles.
+TILE_SIZE = 25
+
+
+def _tile_edges(length: int, tile_size: float) -> list[int]:
+    count = max(1, round(length / tile_size))
+    return [length * i // count for i in range(count + 1)]
+
+
+def _sample_tile(args):
+    x0, y0, width, height, r, k, backend, seed = args
+    return [
+        (x0 + x, y0 + y)
+        for x, y in sample_poisson_uniform(
+            width, height, r, k, backend, random.Random(seed)
+        )
+    ]
+
+
+def sample_poisson_tiled(
+    width: int,
+    height: int,
+    r: float,
+    k: int,
+    backend: str = "python",
+    rng: random.Random | None = None,
+    processes: int | None = None,
+    tile_size: float | None = None,
+) -> list[tuple[float, float]]:
+    """Sample points of the width by height rectangle at least r apart.
+
+    Returns a list of (x, y) tuples, like poisson_disk.sample_poisson_uniform,
+    which each tile is sampled with (using backend). processes is the size of
+    the process pool, by default the number of CPUs; 1 samples the tiles in
+    this process. tile_size is the rough size of the tiles, by default
+    TILE_SIZE times r, but never less than MIN_TILE_SIZE times r. The tiles
+    don't depend on processes, so neither do the points.
+    """
+    rng = rng or random
+    if tile_size is None:
+        tile_size = TILE_SIZE * r
+    tile_size = max(tile_size, MIN_TILE_SIZE * r)
+    xs = _tile_edges(width, tile_size)
+    ys = _tile_edges(height, tile_size)
+    inset = ceil(r / 2)
+
+    tiles = []
+    for x0, x1 in zip(xs, xs[1:]):
+        for y0, y1 in zip(ys, ys[1:]):
+            left = x0 + (inset if x0 > 0 else 0)
+            top = y0 + (inset if y0 > 0 else 0)
+            right = x1 - (inset if x1 < width else 0)
+            bottom = y1 - (inset if y1 < height else 0)
+            tiles.append(
+                (
+                    left,
+                    top,
+                    right - left,
+                    bottom - top,
+                    r,
+                    k,
+                    backend,
+                    rng.getrandbits(64),
+                )
+            )
+
+    if processes == 1 or len(tiles) == 1:
+        samples = map(_sample_tile, tiles)
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            samples = list(pool.map(_sample_tile, tiles))
+    sample_points = [point for sample in samples for point in sample]
+
+    # New points go within 2r of the point they're generated around, so
+    # only points that close to a strip can put any in it.
+    reach = inset + 2 * r
+    seams_x = xs[1:-1]
+    seams_y = ys[1:-1]
+    active = [
+        (x, y)
+        for x, y in sample_points
+        if any(abs(x - seam) < reach for seam in seams_x)
+        or any(abs(y - seam) < reach for seam in seams_y)
+    ]
+    return fill_poisson_uniform(
+        width, height, r, k, sample_points, active, rng, backend == "table"
+    )
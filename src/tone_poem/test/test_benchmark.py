@@ -0,0 +1,30 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+SCRIPT = Path(__file__).parents[3] / "benchmarks" / "map_generation.py"
+
+
+@pytest.fixture
+def map_generation():
+    if not SCRIPT.exists():
+        pytest.skip("benchmarks aren't installed")
+    spec = importlib.util.spec_from_file_location("map_generation", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_benchmark_runs(map_generation, monkeypatch, capsys):
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["map_generation.py", "--cells", "100", "--seeds", "0", "--no-memory"],
+    )
+    map_generation.main()
+    header, *rows = capsys.readouterr().out.splitlines()
+    assert header.split("\t")[:4] == ["case", "dims", "r", "nodes"]
+    assert [row.split("\t")[0] for row in rows] == ["window/100", "scaled/100"]
+    assert all(row.endswith("\t-") for row in rows)
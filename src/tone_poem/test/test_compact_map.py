@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+from ..compact_map import CompactGraphMap
+from ..map import ForestMap
+from ..map_label import NodeNote
+
+
+def edge_set(edges):
+    return {frozenset(edge) for edge in edges}
+
+
+@pytest.fixture(scope="module")
+def forest() -> ForestMap:
+    random.seed(4)
+    forest = ForestMap()
+    forest.add_labels(NodeNote)
+    return forest
+
+
+@pytest.fixture(scope="module")
+def compact(forest: ForestMap) -> CompactGraphMap:
+    return CompactGraphMap.from_map(forest)
+
+
+def test_same_nodes_and_edges(forest: ForestMap, compact: CompactGraphMap):
+    assert set(compact.nodes()) == set(forest.nodes())
+    assert edge_set(compact.edges()) == edge_set(forest.edges())
+    some = list(forest.nodes())[:5]
+    assert edge_set(compact.edges(some)) == edge_set(forest.edges(some))
+
+
+def test_same_neighbors(forest: ForestMap, compact: CompactGraphMap):
+    for node in forest.nodes():
+        assert set(compact.connected_neighbors(node)) == set(
+            forest.connected_neighbors(node)
+        )
+        assert set(compact.all_neighbors(node)) == set(
+            forest.all_neighbors(node)
+        )
+
+
+def test_same_walls_and_labels(forest: ForestMap, compact: CompactGraphMap):
+    assert set(compact.walls) == set(forest.walls)
+    for node in forest.nodes():
+        assert compact.walls_for_node(node) == forest.walls_for_node(node)
+        assert compact.cell_for_node(node) == forest.cell_for_node(node)
+        label = compact.node_label(node)
+        assert type(label) is NodeNote
+        assert str(label) == str(forest.node_label(node))
+        for neighbor in forest.all_neighbors(node):
+            if "wall" in forest.adjacency[node][neighbor]:
+                assert compact.wall_between_nodes(
+                    node, neighbor
+                ) == forest.wall_between_nodes(node, neighbor)
+            else:
+                with pytest.raises(KeyError):
+                    compact.wall_between_nodes(node, neighbor)
+
+
+def test_unknown_node(compact: CompactGraphMap):
+    node = min(compact.nodes())
+    with pytest.raises(KeyError):
+        list(compact.all_neighbors(node + node))
@@ -1,7 +1,19 @@
+import random
+
+import networkx as nx
 import pytest
 
-from ..map import constrain
-from ..tools import Coords, Size
+from .. import voronoi
+from ..map import (
+    ForestMap,
+    GraphMap,
+    constrain,
+    crosses_multiple_walls,
+    prune_long_edges,
+)
+from ..map_label import NodeNote
+from ..tools import Coords, SegmentGrid, Size, distance_squared
+from ..voronoi_incremental import IncrementalVoronoi
 
 
 @pytest.fixture
@@ -97,3 +109,92 @@ def test_negative_infinite_slope(bounds: Size):
         bounds=bounds,
         rightward=True,
     ) == Coords(8, 0)
+
+
+def _prune_one_at_a_time(graph: nx.Graph, max_distance_squared: float):
+    for v1, v2 in list(graph.edges()):
+        if distance_squared(v1, v2) > max_distance_squared:
+            graph.remove_edge(v1, v2)
+            if not nx.is_connected(graph):
+                graph.add_edge(v1, v2)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_prune_long_edges_matches_connectivity_checks(seed: int):
+    rng = random.Random(seed)
+    points = [Coords(i // 101, i % 101) for i in rng.sample(range(101**2), 30)]
+    graph = nx.gnp_random_graph(len(points), 0.2, seed=seed)
+    graph = nx.relabel_nodes(graph, dict(enumerate(points)))
+    for component in list(nx.connected_components(graph))[1:]:
+        graph.add_edge(points[0], next(iter(component)))
+    expected = graph.copy()
+
+    prune_long_edges(graph, 40**2)
+    _prune_one_at_a_time(expected, 40**2)
+
+    assert nx.is_connected(graph)
+    assert set(map(frozenset, graph.edges())) == set(
+        map(frozenset, expected.edges())
+    )
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_forest_labels_are_unambiguous(seed):
+    random.seed(seed)
+    forest = ForestMap()
+    forest.add_labels(NodeNote)
+    for center in forest.graph:
+        pitch_classes = [
+            forest.node_label(neighbor).pitch_class
+            for neighbor in forest.graph[center]
+        ]
+        assert len(pitch_classes) == len(set(pitch_classes))
+
+
+def test_map_retries_broken_diagram(monkeypatch: pytest.MonkeyPatch):
+    attempts = []
+    compute = voronoi.computeVoronoiContext
+
+    def flaky(points, *args, **kwargs):
+        attempts.append(points)
+        if len(attempts) == 1:
+            raise voronoi.VoronoiError("broken")
+        return compute(points, *args, **kwargs)
+
+    monkeypatch.setattr(voronoi, "computeVoronoiContext", flaky)
+    random.seed(0)
+    forest = ForestMap()
+    assert len(attempts) == 2
+    assert attempts[0] != attempts[1]
+    assert set(forest.nodes()) == set(attempts[1])
+
+
+def test_edit_map_in_place():
+    random.seed(3)
+    graph_map = GraphMap()
+    rng = random.Random(1)
+    for _ in range(10):
+        graph_map.remove_node(rng.choice(list(graph_map.nodes())))
+        node = Coords(rng.randrange(60, 740), rng.randrange(60, 540))
+        if node not in graph_map.adjacency:
+            graph_map.insert_node(node)
+
+    nodes = set(graph_map.adjacency.nodes())
+    assert set(graph_map.nodes()) == set(graph_map.cells) == nodes
+    assert nx.is_connected(graph_map.graph)
+    walls = set(graph_map.walls)
+    assert len(walls) == len(graph_map.walls)
+    assert walls == {w for n in nodes for w in graph_map.walls_for_node(n)}
+    assert walls >= {
+        w for _, _, w in graph_map.adjacency.edges(data="wall")
+    } - {None}
+    # the same edges as building the adjacency from scratch
+    delaunay = IncrementalVoronoi(
+        list(nodes), (0, 0, graph_map.dims.w, graph_map.dims.h)
+    ).delaunay_edges()
+    index = SegmentGrid(list(walls), graph_map.min_distance)
+    assert {frozenset(edge) for edge in graph_map.adjacency.edges()} == {
+        frozenset(edge)
+        for edge in delaunay
+        if not crosses_multiple_walls(edge, index)
+    }
@@ -0,0 +1,44 @@
+import threading
+
+import pytest
+
+from ..map import MAP_PHASES, ForestMap
+from ..map_builder import BUILD_PHASES, MapBuilder
+
+
+def test_builds_on_another_thread_and_reports_phases():
+    progress = []
+    threads = set()
+    done = []
+
+    def build(on_phase):
+        threads.add(threading.current_thread())
+        return ForestMap(on_phase=on_phase)
+
+    builder = MapBuilder(
+        build,
+        on_progress=lambda *args: progress.append(args),
+        on_done=done.append,
+    ).start()
+    assert builder.join(timeout=60)
+
+    assert threading.current_thread() not in threads
+    assert progress == [
+        (name, i, len(BUILD_PHASES)) for i, name in enumerate(MAP_PHASES)
+    ]
+    assert done == [builder.result]
+    assert builder.result.graph.number_of_nodes()
+
+
+def test_reports_errors():
+    errors = []
+
+    def build(on_phase):
+        raise RuntimeError("no map for you")
+
+    builder = MapBuilder(
+        build, on_error=errors.append, on_done=pytest.fail
+    ).start()
+    assert builder.join(timeout=60)
+    assert errors == [builder.error]
+    assert builder.result is None
@@ -0,0 +1,33 @@
+import json
+import random
+
+from .. import map, map_cache, map_label
+
+
+def test_cached_map_matches_generated(tmp_path):
+    kw = dict(map_type=map.ForestMap, nodeType=map_label.NodeNote, seed=1234)
+    generated = map_cache.load_or_generate(tmp_path, **kw)
+    assert len(list(tmp_path.iterdir())) == 1
+
+    loaded = map_cache.load_or_generate(tmp_path, **kw)
+    assert type(loaded) is map.ForestMap
+    assert map_cache.dump_map(loaded) == map_cache.dump_map(generated)
+
+
+def test_cache_key_depends_on_seed():
+    kw = dict(map_type=map.ForestMap, dims=map.WINDOW_SIZE, margin=60)
+    assert map_cache.cache_key(
+        seed=1, min_distance=None, **kw
+    ) != map_cache.cache_key(seed=2, min_distance=None, **kw)
+
+
+def test_same_seed_same_map(tmp_path):
+    kw = dict(map_type=map.ForestMap, nodeType=map_label.NodeNote, seed=99)
+    first = map_cache.load_or_generate(tmp_path / "first", **kw)
+    # drawing from the random module in between changes nothing
+    random.seed(5)
+    random.random()
+    second = map_cache.load_or_generate(tmp_path / "second", **kw)
+    assert json.dumps(map_cache.dump_map(first)) == json.dumps(
+        map_cache.dump_map(second)
+    )
@@ -0,0 +1,194 @@
+import random
+import statistics
+from itertools import combinations
+
+import pytest
+
+from ..poisson.datastructures import FlatGrid, RadiusGrid, RandomQueue
+from ..poisson.poisson_disk import sample_poisson, sample_poisson_uniform
+from ..poisson.poisson_tiled import sample_poisson_tiled
+
+
+def too_close(points, r):
+    return [
+        (p, q)
+        for p, q in combinations(points, 2)
+        if (p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2 <= r * r
+    ]
+
+
+@pytest.mark.parametrize("backend", ["python", "table", "numpy"])
+def test_uniform_samples_are_spread_out(backend: str):
+    if backend == "numpy":
+        pytest.importorskip("numpy")
+    random.seed(0)
+    points = sample_poisson_uniform(300, 200, 12, 30, backend)
+    assert all(0 <= x < 300 and 0 <= y < 200 for x, y in points)
+    assert not too_close(points, 12)
+    # Bridson's algorithm fills the rectangle, at about 0.63 points per r^2
+    assert 0.5 < len(points) * 12**2 / (300 * 200) < 0.75
+
+
+def test_numpy_samples_follow_random_seed():
+    pytest.importorskip("numpy")
+    random.seed(1)
+    first = sample_poisson_uniform(200, 100, 10, 30, "numpy")
+    random.seed(1)
+    assert sample_poisson_uniform(200, 100, 10, 30, "numpy") == first
+    assert all(type(x) is float and type(y) is float for x, y in first)
+
+
+def test_unknown_poisson_backend():
+    with pytest.raises(ValueError):
+        sample_poisson_uniform(10, 10, 1, 30, "scipy")
+
+
+def test_flat_grid_square():
+    grid = FlatGrid((4, 3), 2)
+    for x in range(4):
+        for y in range(3):
+            grid.cells[grid.index(x, y)] = (x, y)
+    i = grid.index(0, 2)
+    around = [grid.cells[i + offset] for offset in grid.square_offsets]
+    # the cells that are in the grid, with the border's None for the rest
+    assert len(around) == 25
+    assert sorted(cell for cell in around if cell) == [
+        (x, y) for x in range(3) for y in range(3)
+    ]
+
+
+def test_random_queue_pops_everything_once():
+    queue = RandomQueue(random.Random(6))
+    points = [(float(i), float(-i)) for i in range(50)]
+    queue.push(points[0])
+    queue.extend(points[1:])
+    assert len(queue) == 50
+    popped = [queue.pop() for _ in range(50)]
+    assert popped != points
+    assert sorted(popped) == points
+    assert queue.empty()
+    with pytest.raises(IndexError):
+        queue.pop()
+
+    # elements come back as they went in, not copies
+    pairs = RandomQueue(random.Random(6))
+    pairs.extend(points)
+    assert {id(pairs.pop()) for _ in range(50)} == set(map(id, points))
+
+
+def test_radius_grid_matches_brute_force():
+    rng = random.Random(2)
+    grid = RadiusGrid()
+    points = []
+    for _ in range(300):
+        point = (rng.uniform(-50, 50), rng.uniform(-50, 50), rng.uniform(1, 20))
+        grid.add(*point)
+        points.append(point)
+    for _ in range(500):
+        x, y, r = rng.uniform(-60, 60), rng.uniform(-60, 60), rng.uniform(1, 20)
+        assert grid.crowds(x, y, r) == any(
+            (px - x) ** 2 + (py - y) ** 2 <= min(r, pr) ** 2
+            for px, py, pr in points
+        )
+
+
+def test_variable_radius_samples():
+    def radius(x, y):
+        return 4 + 12 * (int(x) / 300) ** 2
+
+    random.seed(3)
+    points = sample_poisson(300, 150, radius, 30)
+    assert all(0 <= x < 300 and 0 <= y < 150 for x, y in points)
+    for p, q in combinations(points, 2):
+        distance = ((p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2) ** 0.5
+        assert distance > min(radius(*p), radius(*q))
+    left = sum(1 for x, _ in points if x < 75)
+    right = sum(1 for x, _ in points if x >= 225)
+    assert left > 4 * right
+
+    np = pytest.importorskip("numpy")
+    grid = np.array([[radius(x, y) for y in range(150)] for x in range(300)])
+    random.seed(3)
+    assert sample_poisson(300, 150, grid, 30) == points
+
+
+@pytest.mark.parametrize("backend", ["python", "numpy"])
+def test_samples_follow_rng(backend: str):
+    if backend == "numpy":
+        pytest.importorskip("numpy")
+    state = random.getstate()
+    first = sample_poisson_uniform(200, 100, 10, 30, backend, random.Random(4))
+    assert random.getstate() == state
+    second = sample_poisson_uniform(200, 100, 10, 30, backend, random.Random(4))
+    assert first == second
+
+
+def test_tiled_samples_fill_the_seams():
+    def sample(processes):
+        return sample_poisson_tiled(
+            400,
+            300,
+            10,
+            30,
+            rng=random.Random(5),
+            processes=processes,
+            tile_size=90,
+        )
+
+    points = sample(1)
+    assert all(0 <= x < 400 and 0 <= y < 300 for x, y in points)
+    assert not too_close(points, 10)
+    # as dense as sampling the whole rectangle at once, seams included
+    assert 0.5 < len(points) * 10**2 / (400 * 300) < 0.75
+    seams = [x for x, _ in points if abs(x - 200) < 10]
+    assert len(seams) > 0.5 * 20 * 300 / 10**2
+    assert sample(2) == points
+
+
+def test_tiled_samples_ignore_process_count():
+    def sample(processes):
+        return sample_poisson_tiled(
+            600, 450, 6, 30, rng=random.Random(7), processes=processes
+        )
+
+    assert sample(2) == sample(4)
+
+
+def nearest_neighbor_distances(points):
+    return [
+        min(
+            ((p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2) ** 0.5
+            for q in points
+            if q is not p
+        )
+        for p in points
+    ]
+
+
+def test_table_candidates_keep_the_distribution():
+    """Samples drawn with the annulus table look like the usual ones.
+
+    Over 15 samples each, the number of points and the mean and spread of
+    nearest neighbor distances agree to within a few standard errors.
+    """
+
+    def measures(backend):
+        samples = [
+            sample_poisson_uniform(240, 160, 10, 30, backend, random.Random(s))
+            for s in range(15)
+        ]
+        for sample in samples:
+            assert not too_close(sample, 10)
+        distances = [nearest_neighbor_distances(sample) for sample in samples]
+        return [
+            [len(sample) for sample in samples],
+            [statistics.mean(d) for d in distances],
+            [statistics.stdev(d) for d in distances],
+        ]
+
+    for usual, table in zip(measures("python"), measures("table")):
+        error = (
+            statistics.variance(usual) / len(usual)
+            + statistics.variance(table) / len(table)
+        ) ** 0.5
+        assert abs(statistics.mean(usual) - statistics.mean(table)) < 4 * error
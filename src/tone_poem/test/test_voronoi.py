@@ -0,0 +1,352 @@
+import math
+import random
+
+import pytest
+
+from ..tools import Coords
+from ..voronoi import (
+    Consumer,
+    Edge,
+    EdgeList,
+    Halfedge,
+    PrintConsumer,
+    PriorityQueue,
+    Site,
+    SiteList,
+    VoronoiError,
+    clipCells,
+    computeDelaunayTriangulation,
+    computeVoronoiContext,
+    signedArea,
+    validateContext,
+    voronoi,
+)
+
+
+def test_priority_queue_pops_in_sweep_order():
+    rng = random.Random(0)
+    queue = PriorityQueue()
+    halfedges = []
+    for _ in range(200):
+        he = Halfedge()
+        # few distinct y values, so plenty of ties
+        queue.insert(he, Site(rng.randrange(10), rng.randrange(5)), 0)
+        halfedges.append(he)
+    deleted = halfedges[::3]
+    for he in deleted:
+        queue.delete(he)
+    # reinserting a deleted halfedge must not resurrect its old entry
+    queue.insert(deleted[0], Site(3, 2), 1)
+
+    popped = []
+    while not queue.isEmpty():
+        minpt = queue.getMinPt()
+        he = queue.popMinHalfedge()
+        assert minpt == (he.vertex.x, he.ystar)
+        popped.append(he)
+
+    expected = [he for he in halfedges if he.vertex is not None]
+    assert len(popped) == len(expected)
+    keys = [(he.ystar, he.vertex.x) for he in popped]
+    assert keys == sorted(keys)
+    assert sum(he is deleted[0] for he in popped) == 1
+
+
+def in_order(node):
+    if node is None:
+        return []
+    return in_order(node.left) + [node.he] + in_order(node.right)
+
+
+def check_balanced(node) -> int:
+    if node is None:
+        return 0
+    left, right = check_balanced(node.left), check_balanced(node.right)
+    assert abs(left - right) <= 1
+    assert node.height == 1 + max(left, right)
+    return node.height
+
+
+def index(halfedges, he) -> int:
+    # Halfedge.__eq__ compares sweep positions, so look up by identity
+    return next(i for i, other in enumerate(halfedges) if other is he)
+
+
+def test_edge_list_tree_follows_linked_list():
+    rng = random.Random(1)
+    edges = EdgeList()
+    model = [edges.leftend, edges.rightend]
+    for _ in range(2000):
+        interior = model[1:-1]
+        action = rng.random()
+        if interior and action < 0.3:
+            he = rng.choice(interior)
+            edges.delete(he)
+            del model[index(model, he)]
+        elif interior and action < 0.4:
+            old, he = rng.choice(interior), Halfedge()
+            edges.replace(old, he)
+            model[index(model, old)] = he
+        else:
+            left, he = rng.choice(model[:-1]), Halfedge()
+            edges.insert(left, he)
+            model.insert(index(model, left) + 1, he)
+
+    linked = [edges.leftend]
+    while linked[-1] is not edges.rightend:
+        linked.append(linked[-1].right)
+    assert all(a is b for a, b in zip(linked, model, strict=True))
+    tree = in_order(edges.root)
+    assert all(a is b for a, b in zip(tree, model, strict=True))
+    assert check_balanced(edges.root) <= 2 * len(model).bit_length()
+
+
+def voronoi_edges(context) -> dict:
+    """Map each pair of sites to the ends of the edge between them."""
+    edges = {}
+    for line, v1, v2 in context.edges:
+        ends = tuple(None if v == -1 else context.vertices[v] for v in (v1, v2))
+        edges[frozenset(context.sitePairs[line])] = (context.lines[line], ends)
+    return edges
+
+
+def close(a, b) -> bool:
+    return all(
+        math.isclose(x, y, rel_tol=1e-6, abs_tol=1e-6) for x, y in zip(a, b)
+    )
+
+
+def test_numpy_backend_matches_sweep():
+    pytest.importorskip("numpy")
+    rng = random.Random(2)
+    points = [
+        Coords(rng.uniform(0, 500), rng.uniform(0, 300)) for _ in range(600)
+    ]
+    sweep = computeVoronoiContext(points)
+    vectorized = computeVoronoiContext(points, "numpy")
+    # same everything, in the same order, up to rounding
+    assert vectorized.triangles == sweep.triangles
+    assert vectorized.edges == sweep.edges
+    assert vectorized.sitePairs == sweep.sitePairs
+    assert vectorized.polygons == sweep.polygons
+    assert all(map(close, vectorized.vertices, sweep.vertices))
+    assert all(map(close, vectorized.lines, sweep.lines))
+
+
+def test_numpy_backend_with_cocircular_points():
+    pytest.importorskip("numpy")
+    rng = random.Random(3)
+    points = list(
+        {Coords(rng.randrange(40), rng.randrange(25)) for _ in range(600)}
+    )
+    expected = voronoi_edges(computeVoronoiContext(points))
+    actual = voronoi_edges(computeVoronoiContext(points, "numpy"))
+    # The triangles aren't unique, but the Voronoi edges of any positive
+    # length are.
+    for pair, (line, ends) in expected.items():
+        if None not in ends and close(*ends):
+            continue
+        assert close(actual[pair][0], line)
+        for got, want in zip(actual[pair][1], ends):
+            assert (got is None) == (want is None)
+            if want is not None:
+                assert close(got, want)
+
+
+def empty_circle_violations(points, triangles) -> list:
+    """Find the triangles with another point inside their circumcircle."""
+    violations = []
+    for triangle in triangles:
+        (ax, ay), (bx, by), (cx, cy) = (points[i] for i in triangle)
+        d = 2 * (ax * (by - cy) + bx * (cy - ay) + cx * (ay - by))
+        alift, blift, clift = ax**2 + ay**2, bx**2 + by**2, cx**2 + cy**2
+        ux = (alift * (by - cy) + blift * (cy - ay) + clift * (ay - by)) / d
+        uy = (alift * (cx - bx) + blift * (ax - cx) + clift * (bx - ax)) / d
+        r_sqr = (ax - ux) ** 2 + (ay - uy) ** 2
+        if any(
+            (x - ux) ** 2 + (y - uy) ** 2 < r_sqr * (1 - 1e-9)
+            for i, (x, y) in enumerate(points)
+            if i not in triangle
+        ):
+            violations.append(triangle)
+    return violations
+
+
+def test_numpy_backend_is_delaunay_near_the_hull():
+    pytest.importorskip("numpy")
+    # Mostly hull, so most triangles come from the starting fan.
+    square = (
+        [Coords(x, 0) for x in range(0, 1000, 50)]
+        + [Coords(1000, y) for y in range(0, 1000, 50)]
+        + [Coords(x, 1000) for x in range(1000, 0, -50)]
+        + [Coords(0, y) for y in range(1000, 0, -50)]
+        + [Coords(300, 400), Coords(600, 550), Coords(480, 700)]
+    )
+    rng = random.Random(4)
+    blob = [
+        Coords(
+            500 + (300 + 60 * math.sin(3 * a)) * math.cos(a),
+            500 + (300 + 60 * math.sin(3 * a)) * math.sin(a),
+        )
+        for a in (2 * math.pi * (i + rng.random() / 4) / 80 for i in range(80))
+    ] + [Coords(rng.uniform(400, 600), rng.uniform(400, 600)) for _ in range(5)]
+    for points in (square, blob):
+        triangles = computeDelaunayTriangulation(points, "numpy")
+        assert len(triangles) == len(computeDelaunayTriangulation(points))
+        assert not empty_circle_violations(points, triangles)
+
+
+def test_numpy_backend_hands_degenerate_input_to_sweep():
+    pytest.importorskip("numpy")
+    line = [Coords(x, 2 * x) for x in range(10)]
+    assert computeVoronoiContext(line, "numpy").edges == (
+        computeVoronoiContext(line).edges
+    )
+    square = [Coords(0, 0), Coords(1, 0), Coords(1, 1), Coords(0, 1)]
+    assert computeDelaunayTriangulation(square, "numpy") == (
+        computeDelaunayTriangulation(square)
+    )
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        computeVoronoiContext([Coords(0, 0)], "scipy")
+
+
+def test_consumers_get_only_what_they_ask_for():
+    rng = random.Random(6)
+    points = [
+        Coords(rng.uniform(0, 500), rng.uniform(0, 300)) for _ in range(200)
+    ]
+    context = computeVoronoiContext(points)
+    assert computeDelaunayTriangulation(points) == context.triangles
+
+    class EdgeCounter(Consumer):
+        edges = 0
+
+        def outEdge(self, edge):
+            self.edges += 1
+
+    counter = EdgeCounter()
+    voronoi(SiteList(points), counter)
+    assert counter.edges == len(context.edges)
+
+
+def test_print_consumer(capsys):
+    points = [Site(0, 0), Site(4, 0), Site(0, 3)]
+    voronoi(SiteList(points), PrintConsumer(triangulate=True))
+    (triangle,) = capsys.readouterr().out.splitlines()
+    assert sorted(map(int, triangle.split())) == [0, 1, 2]
+    voronoi(SiteList(points), PrintConsumer())
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.split()[0] for line in lines].count("s") == 3
+    assert [line.split()[0] for line in lines].count("e") == 3
+    assert "v 2.000000 1.500000" in lines
+
+
+def test_strict_sweep_raises():
+    points = [Coords(0, 0), Coords(5, 3), Coords(5, 3), Coords(9, 1)]
+    with pytest.raises(VoronoiError):
+        computeVoronoiContext(points, strict=True)
+    # without strict the failure is only printed, as before
+    computeVoronoiContext(points)
+    assert Edge.EDGE_NUM == 0
+
+
+@pytest.mark.parametrize("backend", ["fortune", "numpy"])
+def test_strict_sweep_validates(backend: str):
+    if backend == "numpy":
+        pytest.importorskip("numpy")
+    rng = random.Random(4)
+    scattered = [
+        Coords(rng.uniform(0, 500), rng.uniform(0, 300)) for _ in range(300)
+    ]
+    line = [Coords(x, 3) for x in range(10)]
+    grid = [Coords(x, y) for x in range(8) for y in range(6)]
+    for points in (scattered, line, grid):
+        context = computeVoronoiContext(points, backend, strict=True)
+        validateContext(context, len(points))
+
+
+def test_validate_context_catches_missing_pieces():
+    rng = random.Random(5)
+    points = [
+        Coords(rng.uniform(0, 500), rng.uniform(0, 300)) for _ in range(50)
+    ]
+    context = computeVoronoiContext(points)
+    context.edges.pop()
+    with pytest.raises(VoronoiError):
+        validateContext(context, len(points))
+
+    context = computeVoronoiContext(points)
+    del context.polygons[7]
+    with pytest.raises(VoronoiError):
+        validateContext(context, len(points))
+
+    context = computeVoronoiContext(points)
+    context.polygons[7] = context.polygons[7][1:]
+    with pytest.raises(VoronoiError):
+        validateContext(context, len(points))
+
+
+@pytest.mark.parametrize("backend", ["fortune", "numpy"])
+@pytest.mark.parametrize("seed", range(3))
+def test_clipped_cells_tile_bounds(backend: str, seed: int):
+    if backend == "numpy":
+        pytest.importorskip("numpy")
+    rng = random.Random(seed)
+    scattered = [
+        Coords(rng.uniform(-50, 450), rng.uniform(-50, 350)) for _ in range(200)
+    ]
+    # plenty of vertices shared by four cells
+    grid = list(
+        {
+            Coords(rng.randrange(0, 400, 25), rng.randrange(0, 300, 25))
+            for _ in range(150)
+        }
+    )
+    for points in (scattered, grid):
+        context = computeVoronoiContext(
+            points, backend, bounds=(0, 0, 400, 300)
+        )
+        assert math.isclose(
+            sum(signedArea(cell) for cell in context.cells.values()), 400 * 300
+        )
+        sides = {}
+        for site, cell in context.cells.items():
+            assert cell == [] or signedArea(cell) > 0
+            for i, line in enumerate(context.cellLines[site]):
+                end = cell[(i + 1) % len(cell)]
+                if line == -1:
+                    # (corners of cells meeting on the bounds are the
+                    # sweep's vertices, which may be a rounding error off)
+                    on_bounds = [
+                        close((start, stop), (border, border))
+                        for start, stop, border in [
+                            (cell[i][0], end[0], 0),
+                            (cell[i][0], end[0], 400),
+                            (cell[i][1], end[1], 0),
+                            (cell[i][1], end[1], 300),
+                        ]
+                    ]
+                    assert any(on_bounds)
+                else:
+                    assert site in context.sitePairs[line]
+                    sides.setdefault(line, []).append((cell[i], end))
+        # neighbors agree exactly on the walls between them
+        for first, second in sides.values():
+            assert first == second[::-1]
+
+
+def test_clip_only_some_cells():
+    rng = random.Random(6)
+    points = [
+        Coords(rng.uniform(0, 400), rng.uniform(0, 300)) for _ in range(100)
+    ]
+    context = computeVoronoiContext(points, bounds=(0, 0, 400, 300))
+    cells = context.cells
+    clipCells(context, points, (0, 0, 400, 300), [5, 7])
+    assert context.cells == {5: cells[5], 7: cells[7]}
+    # a single site's cell is all of the bounds
+    context = computeVoronoiContext(points[:1], bounds=(0, 0, 400, 300))
+    assert context.cells == {0: [(0, 0), (400, 0), (400, 300), (0, 300)]}
@@ -0,0 +1,92 @@
+import math
+import random
+
+import pytest
+
+from ..tools import Coords
+from ..voronoi_incremental import IncrementalVoronoi
+
+BOUNDS = (0, 0, 800, 600)
+
+
+def close(a, b) -> bool:
+    return all(math.isclose(x, y, abs_tol=1e-6) for x, y in zip(a, b))
+
+
+def same_polygon(a, b) -> bool:
+    if len(a) != len(b):
+        return False
+    if not a:
+        return True
+    # the cells may start at different corners
+    start = min(range(len(b)), key=lambda i: math.dist(a[0], b[i]))
+    return all(map(close, a, b[start:] + b[:start]))
+
+
+def assert_matches_rebuild(diagram: IncrementalVoronoi, points):
+    rebuilt = IncrementalVoronoi(points, BOUNDS)
+    assert diagram.neighbors == rebuilt.neighbors
+    assert diagram.cells.keys() == rebuilt.cells.keys()
+    for site, cell in rebuilt.cells.items():
+        assert same_polygon(diagram.cells[site], cell)
+    assert diagram.walls.keys() == rebuilt.walls.keys()
+    for pair, (start, end) in rebuilt.walls.items():
+        wall = sum(diagram.walls[pair], ())
+        assert close(wall, start + end) or close(wall, end + start)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_edits_match_rebuild(seed: int):
+    rng = random.Random(seed)
+    points = [
+        Coords(rng.uniform(0, 800), rng.uniform(0, 600)) for _ in range(100)
+    ]
+    diagram = IncrementalVoronoi(points, BOUNDS)
+    for _ in range(30):
+        if rng.random() < 0.5:
+            site = rng.choice(points)
+            points.remove(site)
+            change = diagram.delete(site)
+            assert all(site in edge for edge in change.removed_edges)
+            assert site not in change.cells
+        else:
+            # sometimes outside the bounds, and the hull
+            site = Coords(rng.uniform(-100, 900), rng.uniform(-100, 700))
+            points.append(site)
+            change = diagram.insert(site)
+            assert all(site in edge for edge in change.added_edges)
+            assert change.cells.keys() <= diagram.neighbors[site] | {site}
+    assert_matches_rebuild(diagram, points)
+
+
+def test_change_lists_only_what_changed():
+    rng = random.Random(5)
+    points = [
+        Coords(rng.uniform(0, 800), rng.uniform(0, 600)) for _ in range(100)
+    ]
+    diagram = IncrementalVoronoi(points, BOUNDS)
+    before = dict(diagram.cells)
+    change = diagram.insert(Coords(400, 300))
+    after = IncrementalVoronoi(points + [Coords(400, 300)], BOUNDS)
+    for site in points:
+        if site not in change.cells:
+            assert same_polygon(before[site], after.cells[site])
+    assert len(change.cells) < 15
+
+    with pytest.raises(ValueError):
+        diagram.insert(Coords(400, 300))
+    diagram.delete(Coords(400, 300))
+    assert diagram.neighbors.keys() == set(points)
+
+
+def test_grow_from_nothing():
+    diagram = IncrementalVoronoi([], BOUNDS)
+    points = [Coords(100, 100), Coords(700, 500), Coords(100, 500)]
+    for point in points:
+        diagram.insert(point)
+    assert_matches_rebuild(diagram, points)
+    assert diagram.delaunay_edges() == {
+        (points[0], points[2]),
+        (points[0], points[1]),
+        (points[2], points[1]),
+    }
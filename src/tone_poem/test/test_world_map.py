@@ -0,0 +1,165 @@
+from itertools import combinations
+
+import networkx as nx
+import pytest
+
+from .. import voronoi
+from ..map import GENERATION_ATTEMPTS
+from ..tools import Coords, distance_squared
+from ..world_map import TiledForestMap
+
+SEAM = Coords(1550, 450)
+FAR = 12000
+
+
+def edge_set(graph):
+    return {frozenset(edge) for edge in graph.edges()}
+
+
+@pytest.fixture(scope="module")
+def world() -> TiledForestMap:
+    world = TiledForestMap(seed=3)
+    world.update(SEAM)
+    return world
+
+
+def test_loads_chunks_around_location(world: TiledForestMap):
+    assert world.loaded >= {(0, 0), (1, 0)}
+    assert nx.is_connected(world.graph)
+
+
+def test_points_respect_min_distance_across_seams(world: TiledForestMap):
+    nodes = list(world.graph.nodes())
+    closest = min(distance_squared(a, b) for a, b in combinations(nodes, 2))
+    # points are floored to integer coordinates after sampling
+    assert closest**0.5 > world.min_distance - 2
+
+
+def test_edges_across_seams_have_walls(world: TiledForestMap):
+    crossing = [
+        edge
+        for edge in world.graph.edges()
+        if world.chunk_of(edge[0]) != world.chunk_of(edge[1])
+    ]
+    assert crossing
+    assert all("wall" in world.graph.edges[edge] for edge in crossing)
+
+
+def test_cells_surround_loaded_nodes(world: TiledForestMap):
+    assert set(world.cells) == set(world.graph.nodes())
+    for node, cell in world.cells.items():
+        # counter-clockwise around the node
+        assert all(
+            (b.x - a.x) * (node.y - a.y) - (b.y - a.y) * (node.x - a.x) > 0
+            for a, b in zip(cell, cell[1:] + cell[:1])
+        )
+        # and closed off by walls alone, even at the seams
+        corners = {
+            corner for wall in world.walls_for_node(node) for corner in wall
+        }
+        assert len(corners) == len(cell)
+
+
+def test_evicted_chunks_regenerate_identically():
+    world = TiledForestMap(seed=5)
+    world.update(SEAM)
+    edges, adjacency = edge_set(world.graph), edge_set(world.adjacency)
+    walls = {frozenset(wall) for wall in world.walls}
+
+    for x in range(int(SEAM.x), FAR, 500):
+        world.update(Coords(x, SEAM.y))
+    assert len(world.loaded) <= 4
+    assert not world.loaded & {(0, 0), (1, 0)}
+
+    for x in range(FAR, int(SEAM.x), -500):
+        world.update(Coords(x, SEAM.y))
+    world.update(SEAM)
+    assert edge_set(world.graph) == edges
+    assert edge_set(world.adjacency) == adjacency
+    assert {frozenset(wall) for wall in world.walls} == walls
+
+
+def test_records_built_ahead_match_update(monkeypatch):
+    direct = TiledForestMap(seed=6)
+    direct.update(SEAM)
+
+    ahead = TiledForestMap(seed=6)
+    missing = ahead.missing_records(SEAM)
+    assert missing
+    ahead.add_records(ahead.build_records(missing))
+    assert not ahead.missing_records(SEAM)
+
+    def build_record(*args):
+        pytest.fail("update built a record itself")
+
+    monkeypatch.setattr(ahead, "_build_record", build_record)
+    assert ahead.update(SEAM)
+    assert ahead.loaded == direct.loaded
+    assert edge_set(ahead.graph) == edge_set(direct.graph)
+    assert edge_set(ahead.adjacency) == edge_set(direct.adjacency)
+    assert ahead.cells == direct.cells
+
+
+def fail_sweeps(monkeypatch, count):
+    """Make the next count sweeps fail validation."""
+    sweep = voronoi.computeVoronoiContext
+    failures = iter(range(count))
+
+    def computeVoronoiContext(*args, **kw):
+        if next(failures, None) is not None:
+            raise voronoi.VoronoiError("broken")
+        return sweep(*args, **kw)
+
+    monkeypatch.setattr(voronoi, "computeVoronoiContext", computeVoronoiContext)
+
+
+def test_failed_chunks_are_resampled(monkeypatch):
+    world = TiledForestMap(seed=7, start=SEAM)
+    below = Coords(SEAM.x, 850)
+    fail_sweeps(monkeypatch, 1)
+    world.update(below)
+    monkeypatch.undo()
+
+    [(chunk, attempt)] = world._attempts.items()
+    assert attempt == 1
+    assert chunk not in {(0, 0), (1, 0)}
+    # the same as if the chunk had had its new points all along
+    expected = TiledForestMap(seed=7, start=Coords(FAR, FAR))
+    expected._attempts = {chunk: 1}
+    expected.update(SEAM)
+    expected.update(below)
+    assert world.loaded == expected.loaded
+    assert set(world.graph.nodes()) == set(expected.graph.nodes())
+    assert edge_set(world.graph) == edge_set(expected.graph)
+    assert edge_set(world.adjacency) == edge_set(expected.adjacency)
+    assert world.cells == expected.cells
+    assert world._walls == expected._walls
+
+
+def test_chunks_give_up_eventually(monkeypatch):
+    fail_sweeps(monkeypatch, GENERATION_ATTEMPTS)
+    with pytest.raises(voronoi.VoronoiError):
+        TiledForestMap(seed=7)
+
+
+def test_loaded_chunks_reload_around_resampled_ones(monkeypatch):
+    below = Coords(SEAM.x, 850)
+    world = TiledForestMap(seed=7, start=below)
+    assert (1, 1) in world.loaded
+    # As if records built on another thread had had to resample a chunk
+    # that loaded chunks were swept with meanwhile.
+    fail_sweeps(monkeypatch, 1)
+    world.add_records(world.build_records([(2, 2)]))
+    monkeypatch.undo()
+    assert world._attempts == {(2, 2): 1}
+    assert world.update(below)
+
+    expected = TiledForestMap(seed=7, start=Coords(FAR, FAR))
+    expected._attempts = {(2, 2): 1}
+    expected.update(below)
+    assert world.loaded == expected.loaded
+    assert edge_set(world.graph) == edge_set(expected.graph)
+    assert edge_set(world.adjacency) == edge_set(expected.adjacency)
+    assert world.cells == expected.cells
+    assert world._walls == expected._walls
+    assert world.wall_dict == expected.wall_dict
@@ -104,6 +104,12 @@ class TonePoemApp(App):
                 "Input device": "",
             },
         )
+        config.setdefaults(
+            "Map",
+            {
+                "seed": "",
+            },
+        )
         config.add_callback(
             lambda section, key, value: self.midi_in.open_port(value),
             section="MIDI",
@@ -138,10 +144,21 @@ class TonePoemApp(App):
 
         self.setting_panel = Settings()
 
+        # Keep the same map across restarts so it can be loaded from cache.
+        map_seed = self.config.get("Map", "seed")
+        if not map_seed:
+            map_seed = str(random.randint(0, sys.maxsize))
+            self.config.set("Map", "seed", map_seed)
+            self.config.write()
+
         party = PlayerParty()
         sm = TonePoemGame(
             screen_dict={
-                "area": AreaScreen(name="area"),
+                "area": AreaScreen(
+                    name="area",
+                    map_seed=int(map_seed),
+                    map_cache_dir=os.path.join(self.user_data_dir, "maps"),
+                ),
                 "encounter": EncounterScreen(name="encounter", party=party),
             },
             app=self,
@@ -1,14 +1,13 @@
 import os
-from collections.abc import Iterable
+from collections import defaultdict
+from collections.abc import Generator, Iterable
 from dataclasses import astuple
 from itertools import chain
-from math import sqrt
+from math import floor, sqrt
 
 from kivy.metrics import Metrics
 from pydantic.dataclasses import dataclass
 
-from . import voronoi
-
 
 @dataclass(frozen=True)
 class Scalable:
@@ -115,7 +114,7 @@ class Coords(Scalable):
         return Coords(self.x / dividend, self.y / dividend)
 
     def __lt__(self, other: "Coords"):
-        return astuple(self) < astuple(other)
+        return (self.x, self.y) < (other.x, other.y)
 
 
 @dataclass(frozen=True)
@@ -177,6 +176,43 @@ def intersect(s1, s2):
     )
 
 
+class SegmentGrid:
+    """A uniform grid of buckets indexing line segments by bounding box.
+
+    Used to find the segments that might intersect a given one without
+    testing every pair.
+    """
+
+    def __init__(self, segments: list[tuple[Coords, Coords]], cell_size: float):
+        self.segments = segments
+        self.cell_size = cell_size
+        self.cells: dict[tuple[int, int], list[int]] = defaultdict(list)
+        for index, segment in enumerate(segments):
+            for cell in self._covered_cells(segment):
+                self.cells[cell].append(index)
+
+    def _covered_cells(self, segment):
+        (x1, y1), (x2, y2) = segment
+        i1, i2 = sorted(
+            (floor(x1 / self.cell_size), floor(x2 / self.cell_size))
+        )
+        j1, j2 = sorted(
+            (floor(y1 / self.cell_size), floor(y2 / self.cell_size))
+        )
+        for i in range(i1, i2 + 1):
+            for j in range(j1, j2 + 1):
+                yield i, j
+
+    def near(self, segment) -> Generator[tuple[Coords, Coords], None, None]:
+        """Generate each indexed segment sharing a grid cell with segment."""
+        seen = set()
+        for cell in self._covered_cells(segment):
+            for index in self.cells.get(cell, ()):
+                if index not in seen:
+                    seen.add(index)
+                    yield self.segments[index]
+
+
 def sorted_pair(p1: Coords, p2: Coords) -> tuple[Coords, Coords]:
     return (p1, p2) if p1 < p2 else (p2, p1)
 
@@ -248,4 +284,4 @@ def safe_divide(numer, denom):
 @dataclass
 class WallCrossing:
     wall: tuple[Coords, Coords]
-    path: tuple[voronoi.Vertex, voronoi.Vertex]
+    path: tuple[Coords, Coords]
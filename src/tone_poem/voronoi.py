@@ -33,7 +33,7 @@
 
 #############################################################################
 #
-# For programmatic use two functions are available:
+# For programmatic use three functions are available:
 #
 #   computeVoronoiDiagram(points)
 #
@@ -55,8 +55,20 @@
 #        Returns a list of 3-tuples: the indices of the points that form a
 #        Delaunay triangle.
 #
+#   computeVoronoiContext(points):
+#
+#        Takes a list of point objects (which must have x and y fields).
+#        Returns the Context of a single sweep, which holds both of the
+#        above as well as the bisectors and per-site polygons. Given
+#        bounds, it also holds each site's cell clipped to them.
+#
+# To keep only part of that, or to handle it as it's found instead, pass
+# voronoi(SiteList(points), consumer) a Consumer overriding just the
+# outputs it wants.
+#
 #############################################################################
 import getopt
+import heapq
 import math
 import sys
 from typing import TypeAlias
@@ -64,20 +76,58 @@ from typing import TypeAlias
 TOLERANCE = 1e-9
 BIG_FLOAT = 1e38
 
+# see computeVoronoiContext
+BACKENDS = ("fortune", "numpy")
+
 Vertex: TypeAlias = tuple[float, float]
 Bisector: TypeAlias = tuple[Vertex, Vertex]
 LineEquation: TypeAlias = tuple[float, float, float]
 EdgeTuple: TypeAlias = tuple[int, int, int]
+# (xmin, ymin, xmax, ymax)
+Bounds: TypeAlias = tuple[float, float, float, float]
 
 
 # ------------------------------------------------------------------
-class Context:
-    def __init__(self):
-        self.doPrint = 0
-        self.debug = 0
-        self.plot = 0
-        self.triangulate = False
+class Consumer:
+    """Receives what a sweep finds, as it finds it.
+
+    voronoi() calls outSite with each site in sweep order, outBisector with
+    each new line and the pair of sites it bisects, outTriple and outVertex
+    with the Delaunay triangle and Voronoi vertex of each circle event, and
+    outEdge with each Voronoi edge once both of its ends are known. Every
+    method does nothing here; override only the ones you need.
+    """
 
+    def outSite(self, s):
+        pass
+
+    def outVertex(self, s):
+        pass
+
+    def outTriple(self, s1, s2, s3):
+        pass
+
+    def outBisector(self, edge, sitePair):
+        pass
+
+    def outEdge(self, edge):
+        pass
+
+
+def edgeEnds(edge):
+    """The vertex numbers at the ends of a finished edge, -1 for infinity."""
+    left, right = edge.ep[Edge.LE], edge.ep[Edge.RE]
+    return (
+        -1 if left is None else left.sitenum,
+        -1 if right is None else right.sitenum,
+    )
+
+
+# ------------------------------------------------------------------
+class Context(Consumer):
+    """Collects everything a sweep finds."""
+
+    def __init__(self):
         # list of vertex 2-tuples: (x,y)
         self.vertices: list[Vertex] = []
 
@@ -87,6 +137,9 @@ class Context:
         # (site, site) pairs corresponding to lines
         self.bisectors: list[Bisector] = []
 
+        # (site index, site index) pairs corresponding to lines
+        self.sitePairs: list[tuple[int, int]] = []
+
         # edge 3-tuple: (line index, vertex 1 index, vertex 2 index)
         # if either vertex index is -1, the edge extends to infiinity
         self.edges: list[EdgeTuple] = []
@@ -97,50 +150,78 @@ class Context:
         # a dict of vertex_index:[edges] pairs
         self.polygons: dict[int, list[EdgeTuple]] = {}
 
-    def circle(self, x, y, rad):
-        pass
+        # filled in by clipCells: site index -> counter-clockwise polygon,
+        # and the line index of each of its sides (-1 along the bounds)
+        self.cells: dict[int, list[Vertex]] = {}
+        self.cellLines: dict[int, list[int]] = {}
 
-    def clip_line(self, edge):
-        pass
+    def outVertex(self, s):
+        self.vertices.append((s.x, s.y))
 
-    def line(self, x0, y0, x1, y1):
-        pass
+    def outTriple(self, s1, s2, s3):
+        self.triangles.append((s1.sitenum, s2.sitenum, s3.sitenum))
+
+    def outBisector(self, edge, sitePair):
+        self.lines.append((edge.a, edge.b, edge.c))
+        site1, site2 = sitePair
+        self.bisectors.append(((site1.x, site1.y), (site2.x, site2.y)))
+        self.sitePairs.append((site1.sitenum, site2.sitenum))
+
+    def outEdge(self, edge):
+        sitenumL, sitenumR = edgeEnds(edge)
+        record = (edge.edgenum, sitenumL, sitenumR)
+        self.polygons.setdefault(edge.reg[0].sitenum, []).append(record)
+        self.polygons.setdefault(edge.reg[1].sitenum, []).append(record)
+        self.edges.append(record)
+
+
+# ------------------------------------------------------------------
+class TriangleCollector(Consumer):
+    """Collects just the Delaunay triangles of a sweep."""
+
+    def __init__(self):
+        self.triangles: list[tuple[int, int, int]] = []
+
+    def outTriple(self, s1, s2, s3):
+        self.triangles.append((s1.sitenum, s2.sitenum, s3.sitenum))
+
+
+# ------------------------------------------------------------------
+class PrintConsumer(Consumer):
+    """Prints what a sweep finds in the formats described by usage()."""
+
+    def __init__(self, triangulate=False, debug=False, file=None):
+        self.triangulate = triangulate
+        self.debug = debug
+        self.file = file
+
+    def _print(self, text):
+        print(text, file=self.file or sys.stdout)
 
     def outSite(self, s):
         if self.debug:
-            print("site (%d) at %f %f" % (s.sitenum, s.x, s.y))
-        elif self.triangulate:
-            pass
-        elif self.plot:
-            self.circle(s.x, s.y, cradius)
-        elif self.doPrint:
-            print("s %f %f" % (s.x, s.y))
+            self._print("site (%d) at %f %f" % (s.sitenum, s.x, s.y))
+        elif not self.triangulate:
+            self._print("s %f %f" % (s.x, s.y))
 
     def outVertex(self, s):
-        self.vertices.append((s.x, s.y))
         if self.debug:
-            print("vertex(%d) at %f %f" % (s.sitenum, s.x, s.y))
-        elif self.triangulate:
-            pass
-        elif self.doPrint and not self.plot:
-            print("v %f %f" % (s.x, s.y))
+            self._print("vertex(%d) at %f %f" % (s.sitenum, s.x, s.y))
+        elif not self.triangulate:
+            self._print("v %f %f" % (s.x, s.y))
 
     def outTriple(self, s1, s2, s3):
-        self.triangles.append((s1.sitenum, s2.sitenum, s3.sitenum))
         if self.debug:
-            print(
+            self._print(
                 "circle through left=%d right=%d bottom=%d"
                 % (s1.sitenum, s2.sitenum, s3.sitenum)
             )
-        elif self.triangulate and self.doPrint and not self.plot:
-            print("%d %d %d" % (s1.sitenum, s2.sitenum, s3.sitenum))
+        elif self.triangulate:
+            self._print("%d %d %d" % (s1.sitenum, s2.sitenum, s3.sitenum))
 
     def outBisector(self, edge, sitePair):
-        self.lines.append((edge.a, edge.b, edge.c))
-        site1, site2 = sitePair
-        self.bisectors.append(((site1.x, site1.y), (site2.x, site2.y)))
         if self.debug:
-            print(
+            self._print(
                 "line(%d) %gx+%gy=%g, bisecting %d %d"
                 % (
                     edge.edgenum,
@@ -151,63 +232,49 @@ class Context:
                     edge.reg[1].sitenum,
                 )
             )
-        elif self.triangulate:
-            if self.plot:
-                self.line(
-                    edge.reg[0].x, edge.reg[0].y, edge.reg[1].x, edge.reg[1].y
-                )
-        elif self.doPrint and not self.plot:
-            print("l %f %f %f" % (edge.a, edge.b, edge.c))
+        elif not self.triangulate:
+            self._print("l %f %f %f" % (edge.a, edge.b, edge.c))
 
     def outEdge(self, edge):
-        sitenumL = -1
-        if edge.ep[Edge.LE] is not None:
-            sitenumL = edge.ep[Edge.LE].sitenum
-        sitenumR = -1
-        if edge.ep[Edge.RE] is not None:
-            sitenumR = edge.ep[Edge.RE].sitenum
-        if edge.reg[0].sitenum not in self.polygons:
-            self.polygons[edge.reg[0].sitenum] = []
-        if edge.reg[1].sitenum not in self.polygons:
-            self.polygons[edge.reg[1].sitenum] = []
-        self.polygons[edge.reg[0].sitenum].append(
-            (edge.edgenum, sitenumL, sitenumR)
-        )
-        self.polygons[edge.reg[1].sitenum].append(
-            (edge.edgenum, sitenumL, sitenumR)
-        )
-        self.edges.append((edge.edgenum, sitenumL, sitenumR))
         if not self.triangulate:
-            if self.plot:
-                self.clip_line(edge)
-            elif self.doPrint:
-                print(
-                    "e %d" % edge.edgenum,
-                )
-                print(
-                    " %d " % sitenumL,
-                )
-                print("%d" % sitenumR)
+            self._print("e %d %d %d" % (edge.edgenum, *edgeEnds(edge)))
 
 
 # ------------------------------------------------------------------
-def voronoi(siteList, context):
+class VoronoiError(Exception):
+    """The sweep failed, or what it made doesn't hold together."""
+
+
+# ------------------------------------------------------------------
+def voronoi(siteList, consumer, strict=False):
+    """Sweep over the sites, passing what it finds on to consumer.
+
+    consumer is a Consumer: a Context to keep everything, or anything else
+    that only wants some of it. If anything goes wrong partway, consumer
+    has only been told part of the diagram: in strict mode that raises
+    VoronoiError, otherwise it's only printed.
+    """
     try:
-        edgeList = EdgeList(siteList.xmin, siteList.xmax, len(siteList))
-        priorityQ = PriorityQueue(siteList.ymin, siteList.ymax, len(siteList))
+        edgeList = EdgeList()
+        priorityQ = PriorityQueue()
         siteIter = siteList.iterator()
 
         bottomsite = next(siteIter)
-        context.outSite(bottomsite)
+        consumer.outSite(bottomsite)
         newsite = next(siteIter)
-        minpt = Site(-BIG_FLOAT, -BIG_FLOAT)
+        minx = miny = -BIG_FLOAT
         while True:
             if not priorityQ.isEmpty():
-                minpt = priorityQ.getMinPt()
+                minx, miny = priorityQ.getMinPt()
 
-            if newsite and (priorityQ.isEmpty() or newsite < minpt):
+            # compare the same way as Site.__lt__
+            if newsite and (
+                priorityQ.isEmpty()
+                or newsite.y < miny
+                or (newsite.y == miny and newsite.x < minx)
+            ):
                 # newsite is smallest -  this is a site event
-                context.outSite(newsite)
+                consumer.outSite(newsite)
 
                 # get first Halfedge to the LEFT and RIGHT of the new site
                 lbnd = edgeList.leftbnd(newsite)
@@ -217,7 +284,7 @@ def voronoi(siteList, context):
                 # create a new edge that bisects
                 bot = lbnd.rightreg(bottomsite)
                 edge = Edge.bisect(bot, newsite)
-                context.outBisector(edge, (bot, newsite))
+                consumer.outBisector(edge, (bot, newsite))
 
                 # create a new Halfedge, setting its pm field to 0 and insert
                 # this new bisector edge between the left and right vectors in
@@ -265,24 +332,23 @@ def voronoi(siteList, context):
                 # output the triple of sites, stating that a circle goes through them
                 mid = lbnd.rightreg(bottomsite)
                 triangle = (bot, top, mid)
-                context.outTriple(*triangle)
+                consumer.outTriple(*triangle)
 
                 # get the vertex that caused this event and set the vertex number
                 # couldn't do this earlier since we didn't know when it would be processed
                 v = lbnd.vertex
                 siteList.setSiteNumber(v)
-                context.outVertex(v)
+                consumer.outVertex(v)
 
                 # set the endpoint of the left and right Halfedge to be this vector
                 if lbnd.edge.setEndpoint(lbnd.pm, v):
-                    context.outEdge(lbnd.edge)
+                    consumer.outEdge(lbnd.edge)
 
                 if rbnd.edge.setEndpoint(rbnd.pm, v):
-                    context.outEdge(rbnd.edge)
+                    consumer.outEdge(rbnd.edge)
 
-                # delete the lowest HE, remove all vertex events to do with the
-                # right HE and delete the right HE
-                edgeList.delete(lbnd)
+                # remove all vertex events to do with the right HE and delete
+                # the right HE (the lowest HE is replaced further down)
                 priorityQ.delete(rbnd)
                 edgeList.delete(rbnd)
 
@@ -296,18 +362,19 @@ def voronoi(siteList, context):
                 # Create an Edge (or line) that is between the two Sites.  This
                 # creates the formula of the line, and assigns a line number to it
                 edge = Edge.bisect(bot, top)
-                context.outBisector(edge, (bot, top))
+                consumer.outBisector(edge, (bot, top))
 
                 # create a HE from the edge
                 bisector = Halfedge(edge, pm)
 
-                # insert the new bisector to the right of the left HE
+                # put the new bisector in place of the lowest HE, i.e. to the
+                # right of the left HE
                 # set one endpoint to the new edge to be the vector point 'v'
                 # If the site to the left of this bisector is higher than the right
                 # Site, then this endpoint is put in position 0; otherwise in pos 1
-                edgeList.insert(llbnd, bisector)
+                edgeList.replace(lbnd, bisector)
                 if edge.setEndpoint(Edge.RE - pm, v):
-                    context.outEdge(edge)
+                    consumer.outEdge(edge)
 
                 # if left HE and the new bisector don't intersect, then delete
                 # the left HE, and reinsert it
@@ -325,12 +392,197 @@ def voronoi(siteList, context):
 
         he = edgeList.leftend.right
         while he is not edgeList.rightend:
-            context.outEdge(he.edge)
+            # an edge without any vertices (only from collinear sites) still
+            # has both its halfedges here, so output it once
+            if he.pm == Edge.LE or he.edge.ep != [None, None]:
+                consumer.outEdge(he.edge)
             he = he.right
-        Edge.EDGE_NUM = 0
     except Exception as err:
+        if strict:
+            raise VoronoiError(f"sweep failed: {err}") from err
         print("######################################################")
         print(str(err))
+    finally:
+        Edge.EDGE_NUM = 0
+
+
+# ------------------------------------------------------------------
+def validateContext(context, siteCount):
+    """Check that a finished Context is a whole Voronoi diagram.
+
+    Raises VoronoiError unless Euler's formula holds, counting one extra
+    vertex at infinity where the rays meet and a face per site, and every
+    site's polygon is closed: its edges join up into a single loop, using
+    each of its finite vertices exactly twice.
+    """
+    if siteCount < 2:
+        return
+    euler = len(context.vertices) + 1 - len(context.edges) + siteCount
+    if euler != 2:
+        raise VoronoiError(f"V - E + F is {euler}, not 2")
+    for site in range(siteCount):
+        edges = context.polygons.get(site)
+        if not edges:
+            raise VoronoiError(f"site {site} has no polygon")
+        neighbors = {}
+        for _, v1, v2 in edges:
+            neighbors.setdefault(v1, []).append(v2)
+            neighbors.setdefault(v2, []).append(v1)
+        for vertex, others in neighbors.items():
+            if len(others) % 2 or (vertex != -1 and len(others) != 2):
+                raise VoronoiError(
+                    f"polygon of site {site} isn't closed at vertex {vertex}"
+                )
+        start = edges[0][1]
+        seen = {start}
+        stack = [start]
+        while stack:
+            for other in neighbors[stack.pop()]:
+                if other not in seen:
+                    seen.add(other)
+                    stack.append(other)
+        if len(seen) != len(neighbors):
+            raise VoronoiError(f"polygon of site {site} is in pieces")
+
+
+# ------------------------------------------------------------------
+def signedArea(polygon):
+    """The area of polygon, positive if it's counter-clockwise."""
+    return (
+        sum(
+            x1 * y2 - x2 * y1
+            for (x1, y1), (x2, y2) in zip(polygon, polygon[1:] + polygon[:1])
+        )
+        / 2
+    )
+
+
+# ------------------------------------------------------------------
+def clipCells(context, points, bounds, sites=None):
+    """Fill in context.cells with the Voronoi cell of each site, clipped to
+    bounds, a rectangle (xmin, ymin, xmax, ymax).
+
+    Each cell is a closed polygon listed counter-clockwise, without
+    repeating its first vertex; side i runs from vertex i to vertex i + 1
+    and lies on line context.cellLines[site][i], or on the bounds if that
+    is -1. Where two edges meet, the corner is the context's own vertex,
+    and neighboring cells have exactly the same corners. A cell entirely
+    outside bounds is empty. If sites are given, only their cells are
+    worked out.
+    """
+    xmin, ymin, xmax, ymax = bounds
+    # Lines through a vertex shared by more than three cells needn't meet
+    # exactly there, so corners are snapped to a fine grid, keeping the
+    # first point seen in each square, starting with the context's own.
+    grain = TOLERANCE * max(xmax - xmin, ymax - ymin, 1)
+    corners = {}
+
+    def snap(point):
+        x, y = point
+        return corners.setdefault((round(x / grain), round(y / grain)), point)
+
+    vertexCorners = [snap(vertex) for vertex in context.vertices]
+    # the sides of the bounds, as lines -1 to -4
+    borders = {
+        -1: (0, 1, ymin),
+        -2: (1, 0, xmax),
+        -3: (0, 1, ymax),
+        -4: (1, 0, xmin),
+    }
+    rectangle = [
+        (snap((xmin, ymin)), -1),
+        (snap((xmax, ymin)), -2),
+        (snap((xmax, ymax)), -3),
+        (snap((xmin, ymax)), -4),
+    ]
+    lineEnds = {line: (v1, v2) for line, v1, v2 in context.edges}
+
+    def meet(line1, line2):
+        # line2 is always a Voronoi line, the one being clipped by
+        a2, b2, c2 = context.lines[line2]
+        if line1 < 0:
+            a1, b1, k = borders[line1]
+            if a1:
+                return snap((k, (c2 - a2 * k) / b2))
+            return snap(((c2 - b2 * k) / a2, k))
+        for v in lineEnds[line1]:
+            if v != -1 and v in lineEnds[line2]:
+                return vertexCorners[v]
+        a1, b1, c1 = context.lines[line1]
+        det = a1 * b2 - a2 * b1
+        return snap(((c1 * b2 - c2 * b1) / det, (a1 * c2 - a2 * c1) / det))
+
+    def walk(edges):
+        # a cell inside the bounds is just its edges, put in order
+        ends = {}
+        for line, v1, v2 in edges:
+            if v1 == -1 or v2 == -1 or not (inBounds[v1] and inBounds[v2]):
+                return None
+            ends.setdefault(v1, []).append((line, v2))
+            ends.setdefault(v2, []).append((line, v1))
+        if any(len(others) != 2 for others in ends.values()):
+            return None
+        line, vertex, _ = edges[0]
+        cell = []
+        for _ in edges:
+            cell.append((vertexCorners[vertex], line))
+            (line1, end1), (line2, end2) = ends[vertex]
+            vertex = end1 if line1 == line else end2
+            (line1, _), (line2, _) = ends[vertex]
+            line = line2 if line1 == line else line1
+        if vertex != edges[0][1]:
+            return None
+        if signedArea([vertex for vertex, _ in cell]) < 0:
+            cell = [
+                (cell[i][0], cell[i - 1][1])
+                for i in range(len(cell) - 1, -1, -1)
+            ]
+        return cell
+
+    def clip(point, edges):
+        cell = rectangle
+        for line, _, _ in edges:
+            a, b, c = context.lines[line]
+            sign = 1 if a * point.x + b * point.y >= c else -1
+            inside = [
+                sign * (a * x + b * y - c) >= -TOLERANCE for (x, y), _ in cell
+            ]
+            if all(inside):
+                continue
+            clipped = []
+            for i, (vertex, side) in enumerate(cell):
+                nextInside = inside[(i + 1) % len(cell)]
+                if inside[i]:
+                    clipped.append((vertex, side))
+                    if not nextInside:
+                        clipped.append((meet(side, line), line))
+                elif nextInside:
+                    clipped.append((meet(side, line), side))
+            cell = clipped
+            if not cell:
+                break
+        return cell
+
+    inBounds = [
+        xmin <= x <= xmax and ymin <= y <= ymax for x, y in context.vertices
+    ]
+    context.cells = {}
+    context.cellLines = {}
+    for site in range(len(points)) if sites is None else sites:
+        edges = context.polygons.get(site, [])
+        cell = walk(edges) if edges else None
+        if cell is None:
+            cell = clip(points[site], edges)
+        # drop the sides clipping left with no length
+        cell = [
+            (vertex, side)
+            for i, (vertex, side) in enumerate(cell)
+            if vertex != cell[(i + 1) % len(cell)][0]
+        ]
+        if len(cell) < 3:
+            cell = []
+        context.cells[site] = [vertex for vertex, _ in cell]
+        context.cellLines[site] = [max(side, -1) for _, side in cell]
 
 
 # ------------------------------------------------------------------
@@ -342,6 +594,8 @@ def isEqual(a, b, relativeError=TOLERANCE):
 
 # ------------------------------------------------------------------
 class Site(object):
+    __slots__ = ("x", "y", "sitenum")
+
     def __init__(self, x=0.0, y=0.0, sitenum=0):
         self.x = x
         self.y = y
@@ -366,6 +620,8 @@ class Edge(object):
     EDGE_NUM = 0
     DELETED = {}  # marker value
 
+    __slots__ = ("a", "b", "c", "ep", "reg", "edgenum")
+
     def __init__(self):
         self.a = 0.0
         self.b = 0.0
@@ -420,10 +676,22 @@ class Edge(object):
 
 # ------------------------------------------------------------------
 class Halfedge(object):
+    __slots__ = (
+        "left",
+        "right",
+        "qentry",
+        "node",
+        "edge",
+        "pm",
+        "vertex",
+        "ystar",
+    )
+
     def __init__(self, edge=None, pm=Edge.LE):
         self.left = None  # left Halfedge in the edge list
         self.right = None  # right Halfedge in the edge list
-        self.qnext = None  # priority queue linked list pointer
+        self.qentry = None  # priority queue heap entry
+        self.node = None  # BeachNode in the edge list's tree
         self.edge = edge  # edge list Edge
         self.pm = pm
         self.vertex = None  # Site()
@@ -551,22 +819,40 @@ class Halfedge(object):
 
 
 # ------------------------------------------------------------------
+class BeachNode(object):
+    """A node of the AVL tree EdgeList keeps over its halfedges."""
+
+    __slots__ = ("he", "parent", "left", "right", "height")
+
+    def __init__(self, he, parent=None):
+        self.he = he
+        he.node = self
+        self.parent = parent
+        self.left = None
+        self.right = None
+        self.height = 1
+
+
+def nodeHeight(node):
+    return node.height if node else 0
+
+
 class EdgeList(object):
-    def __init__(self, xmin, xmax, nsites):
-        if xmin > xmax:
-            xmin, xmax = xmax, xmin
-        self.hashsize = int(2 * math.sqrt(nsites + 4))
+    """The beach line: halfedges in left to right order.
 
-        self.xmin = xmin
-        self.deltax = float(xmax - xmin)
-        self.hash = [None] * self.hashsize
+    They're kept both as a doubly linked list, for walking to neighbors,
+    and as an AVL tree in the same order, so leftbnd takes logarithmic time
+    however many halfedges there are.
+    """
 
+    def __init__(self):
         self.leftend = Halfedge()
         self.rightend = Halfedge()
         self.leftend.right = self.rightend
         self.rightend.left = self.leftend
-        self.hash[0] = self.leftend
-        self.hash[-1] = self.rightend
+        self.root = BeachNode(self.leftend)
+        self.root.right = BeachNode(self.rightend, self.root)
+        self.root.height = 2
 
     def insert(self, left, he):
         he.left = left
@@ -574,75 +860,147 @@ class EdgeList(object):
         left.right.left = he
         left.right = he
 
+        # he goes right after left in the tree too
+        parent = left.node
+        if parent.right is None:
+            parent.right = BeachNode(he, parent)
+        else:
+            parent = parent.right
+            while parent.left is not None:
+                parent = parent.left
+            parent.left = BeachNode(he, parent)
+        self.rebalance(parent)
+
     def delete(self, he):
         he.left.right = he.right
         he.right.left = he.left
         he.edge = Edge.DELETED
 
-    # Get entry from hash table, pruning any deleted nodes
-    def gethash(self, b):
-        if b < 0 or b >= self.hashsize:
-            return None
-        he = self.hash[b]
-        if he is None or he.edge is not Edge.DELETED:
-            return he
-
-        #  Hash table points to deleted half edge.  Patch as necessary.
-        self.hash[b] = None
-        return None
-
-    def leftbnd(self, pt):
-        # Use hash table to get close to desired halfedge
-        bucket = int(((pt.x - self.xmin) / self.deltax * self.hashsize))
-
-        if bucket < 0:
-            bucket = 0
-
-        if bucket >= self.hashsize:
-            bucket = self.hashsize - 1
-
-        he = self.gethash(bucket)
-        if he is None:
-            i = 1
-            while True:
-                he = self.gethash(bucket - i)
-                if he is not None:
-                    break
-                he = self.gethash(bucket + i)
-                if he is not None:
-                    break
-                i += 1
-
-        # Now search linear list of halfedges for the corect one
-        if (he is self.leftend) or (
-            he is not self.rightend and he.isPointRightOf(pt)
-        ):
-            he = he.right
-            while he is not self.rightend and he.isPointRightOf(pt):
-                he = he.right
-            he = he.left
+        node = he.node
+        he.node = None
+        if node.left is not None and node.right is not None:
+            # Take the place of the next halfedge along, then remove that.
+            successor = node.right
+            while successor.left is not None:
+                successor = successor.left
+            node.he = successor.he
+            node.he.node = node
+            node = successor
+        child = node.left if node.left is not None else node.right
+        if child is not None:
+            child.parent = node.parent
+        self.replaceChild(node.parent, node, child)
+        self.rebalance(node.parent)
+
+    def replace(self, old, he):
+        """Put he where old is, then delete old.
+
+        The same as inserting he after old and deleting old, but the tree
+        doesn't need rebalancing.
+        """
+        he.left = old.left
+        he.right = old.right
+        old.left.right = he
+        old.right.left = he
+        old.edge = Edge.DELETED
+
+        old.node.he = he
+        he.node = old.node
+        old.node = None
+
+    def replaceChild(self, parent, old, new):
+        if parent is None:
+            self.root = new
+        elif parent.left is old:
+            parent.left = new
         else:
-            he = he.left
-            while he is not self.leftend and not he.isPointRightOf(pt):
-                he = he.left
+            parent.right = new
+
+    def rotateLeft(self, node):
+        pivot = node.right
+        node.right = pivot.left
+        if pivot.left is not None:
+            pivot.left.parent = node
+        pivot.parent = node.parent
+        self.replaceChild(node.parent, node, pivot)
+        pivot.left = node
+        node.parent = pivot
+        node.height = 1 + max(nodeHeight(node.left), nodeHeight(node.right))
+        pivot.height = 1 + max(nodeHeight(pivot.left), nodeHeight(pivot.right))
+        return pivot
+
+    def rotateRight(self, node):
+        pivot = node.left
+        node.left = pivot.right
+        if pivot.right is not None:
+            pivot.right.parent = node
+        pivot.parent = node.parent
+        self.replaceChild(node.parent, node, pivot)
+        pivot.right = node
+        node.parent = pivot
+        node.height = 1 + max(nodeHeight(node.left), nodeHeight(node.right))
+        pivot.height = 1 + max(nodeHeight(pivot.left), nodeHeight(pivot.right))
+        return pivot
+
+    def rebalance(self, node):
+        # Walk up from node until a subtree's height comes out unchanged,
+        # since nothing above it can have changed either. Heights are read
+        # inline rather than through nodeHeight, as this is the hot loop.
+        while node is not None:
+            height = node.height
+            left, right = node.left, node.right
+            leftHeight = left.height if left else 0
+            rightHeight = right.height if right else 0
+            if leftHeight - rightHeight > 1:
+                if nodeHeight(left.left) < nodeHeight(left.right):
+                    self.rotateLeft(left)
+                node = self.rotateRight(node)
+            elif rightHeight - leftHeight > 1:
+                if nodeHeight(right.right) < nodeHeight(right.left):
+                    self.rotateRight(right)
+                node = self.rotateLeft(node)
+            else:
+                node.height = 1 + (
+                    leftHeight if leftHeight > rightHeight else rightHeight
+                )
+            if node.height == height:
+                break
+            node = node.parent
 
-        # Update hash table and reference counts
-        if bucket > 0 and bucket < self.hashsize - 1:
-            self.hash[bucket] = he
-        return he
+    def leftbnd(self, pt):
+        """Find the rightmost halfedge that pt is right of.
+
+        pt is right of every halfedge up to some point along the beach line
+        and of none after it, so this is a binary search down the tree.
+        """
+        bound = self.leftend
+        node = self.root
+        while node is not None:
+            he = node.he
+            if he is self.leftend or (
+                he is not self.rightend and he.isPointRightOf(pt)
+            ):
+                bound = he
+                node = node.right
+            else:
+                node = node.left
+        return bound
 
 
 # ------------------------------------------------------------------
 class PriorityQueue(object):
-    def __init__(self, ymin, ymax, nsites):
-        self.ymin = ymin
-        self.deltay = ymax - ymin
-        self.hashsize = int(4 * math.sqrt(nsites))
+    """Halfedges waiting to be swept, ordered by (ystar, vertex x).
+
+    This is a binary heap of [ystar, x, -insertion number, halfedge] entries,
+    so halfedges that tie come out last in, first out, as they did from the
+    bucketed linked lists this replaces. Deleting a halfedge just blanks its
+    entry, which is skipped when it reaches the top.
+    """
+
+    def __init__(self):
+        self.heap = []
         self.count = 0
-        self.minidx = 0
-        self.hash = []
-        for i in range(self.hashsize):
-            self.hash.append(Halfedge())
+        self.inserted = 0
 
     def __len__(self):
         return self.count
@@ -653,45 +1011,32 @@ class PriorityQueue(object):
     def insert(self, he, site, offset):
         he.vertex = site
         he.ystar = site.y + offset
-        last = self.hash[self.getBucket(he)]
-        next = last.qnext
-        while (next is not None) and he > next:
-            last = next
-            next = last.qnext
-        he.qnext = last.qnext
-        last.qnext = he
+        self.inserted += 1
+        he.qentry = [he.ystar, site.x, -self.inserted, he]
+        heapq.heappush(self.heap, he.qentry)
         self.count += 1
 
     def delete(self, he):
         if he.vertex is not None:
-            last = self.hash[self.getBucket(he)]
-            while last.qnext is not he:
-                last = last.qnext
-            last.qnext = he.qnext
+            he.qentry[-1] = None
+            he.qentry = None
             self.count -= 1
             he.vertex = None
 
-    def getBucket(self, he):
-        bucket = int(((he.ystar - self.ymin) / self.deltay) * self.hashsize)
-        if bucket < 0:
-            bucket = 0
-        if bucket >= self.hashsize:
-            bucket = self.hashsize - 1
-        if bucket < self.minidx:
-            self.minidx = bucket
-        return bucket
+    def discardDeleted(self):
+        while self.heap[0][-1] is None:
+            heapq.heappop(self.heap)
 
     def getMinPt(self):
-        while self.hash[self.minidx].qnext is None:
-            self.minidx += 1
-        he = self.hash[self.minidx].qnext
-        x = he.vertex.x
-        y = he.ystar
-        return Site(x, y)
+        """Get the (x, ystar) of the next halfedge, without popping it."""
+        self.discardDeleted()
+        ystar, x, _, _ = self.heap[0]
+        return x, ystar
 
     def popMinHalfedge(self):
-        curr = self.hash[self.minidx].qnext
-        self.hash[self.minidx].qnext = curr.qnext
+        self.discardDeleted()
+        curr = heapq.heappop(self.heap)[-1]
+        curr.qentry = None
         self.count -= 1
         return curr
 
@@ -763,7 +1108,7 @@ class SiteList(object):
 
 
 # ------------------------------------------------------------------
-def computeVoronoiDiagram(points):
+def computeVoronoiDiagram(points, backend="fortune", strict=False):
     """Takes a list of point objects (which must have x and y fields).
     Returns a 3-tuple of:
 
@@ -775,31 +1120,60 @@ def computeVoronoiDiagram(points):
            Voronoi diagram.  l is the index of the line, v1 and v2 are
            the indices of the vetices at the end of the edge.  If
            v1 or v2 is -1, the line extends to infinity.
+
+    backend is one of BACKENDS: "fortune" for the sweep in this module,
+    or "numpy" for the vectorized one in voronoi_numpy, which is much
+    faster on large inputs and needs numpy installed. If strict is set,
+    failures raise VoronoiError, and so does a result that doesn't pass
+    validateContext.
     """
-    siteList = SiteList(points)
-    context = Context()
-    voronoi(siteList, context)
+    context = computeVoronoiContext(points, backend, strict)
     return (context.vertices, context.lines, context.edges)
 
 
 # ------------------------------------------------------------------
-def computeDelaunayTriangulation(points):
+def computeVoronoiContext(points, backend="fortune", strict=False, bounds=None):
+    """Takes a list of point objects (which must have x and y fields).
+    Returns the Context of a single sweep over the points, holding the
+    Delaunay triangles as well as the Voronoi vertices, lines, edges,
+    bisectors and polygons, so callers needing both don't sweep twice.
+    If bounds are given, the cells are also clipped to them by clipCells.
+    """
+    if backend == "numpy":
+        from . import voronoi_numpy
+
+        context = voronoi_numpy.computeVoronoiContext(points, strict)
+    elif backend == "fortune":
+        context = Context()
+        voronoi(SiteList(points), context, strict)
+    else:
+        raise ValueError(f"unknown Voronoi backend {backend!r}")
+    if strict:
+        validateContext(context, len(points))
+    if bounds is not None:
+        clipCells(context, points, bounds)
+    return context
+
+
+# ------------------------------------------------------------------
+def computeDelaunayTriangulation(points, backend="fortune", strict=False):
     """Takes a list of point objects (which must have x and y fields).
     Returns a list of 3-tuples: the indices of the points that form a
     Delaunay triangle.
     """
-    siteList = SiteList(points)
-    context = Context()
-    context.triangulate = True
-    voronoi(siteList, context)
-    return context.triangles
+    if backend != "fortune" or strict:
+        # validating needs the whole diagram
+        return computeVoronoiContext(points, backend, strict).triangles
+    collector = TriangleCollector()
+    voronoi(SiteList(points), collector)
+    return collector.triangles
 
 
 def usage():
     print("""
 voronoi - compute Voronoi diagram or Delaunay triangulation
 
-voronoi [-t -p -d]  [filename]
+voronoi [-t -d]  [filename]
 
 Voronoi reads from filename (or standard input if no filename given) for a set
 of points in the plane and writes either the Voronoi diagram or the Delaunay
@@ -824,9 +1198,6 @@ Other options include:
 
 d    Print debugging info
 
-p    Produce output suitable for input to plot (1), rather than the forms
-     described above.
-
 On unsorted data uniformly distributed in the unit square, voronoi uses about
 20n+140 bytes of storage.
 
@@ -839,21 +1210,18 @@ Algorithmica 2, 153-174.
 # -----------------------------------------------------------------------------
 if __name__ == "__main__":
     try:
-        optlist, args = getopt.getopt(sys.argv[1:], "thdp")
+        optlist, args = getopt.getopt(sys.argv[1:], "thd")
     except getopt.GetoptError:
         usage()
         sys.exit(2)
 
     doHelp = 0
-    c = Context()
-    c.doPrint = 1
+    triangulate = debug = False
     for opt in optlist:
         if opt[0] == "-d":
-            c.debug = 1
-        if opt[0] == "-p":
-            c.plot = 1
+            debug = True
         if opt[0] == "-t":
-            c.triangulate = 1
+            triangulate = True
         if opt[0] == "-h":
             doHelp = 1
 
@@ -875,4 +1243,4 @@ if __name__ == "__main__":
         sys.exit(2)
 
     sl = SiteList(pts)
-    voronoi(sl, c)
+    voronoi(sl, PrintConsumer(triangulate, debug))
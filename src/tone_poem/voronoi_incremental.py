@@ -0,0 +1,202 @@
+"""Voronoi diagrams that can be edited a site at a time.
+
+Inserting or deleting a site only changes the cells of the sites around it:
+
+- inserting p changes exactly the cells of p's new Delaunay neighbors, and
+  gives each of them the one extra neighbor p;
+- deleting q changes exactly the cells of q's old neighbors, which only gain
+  neighbors from among each other.
+
+A cell depends on nothing but its site's Delaunay neighbors, so sweeping the
+changed sites together with all of their neighbors gets the changed cells
+exactly right. Each edit does that, with the sweep from the voronoi module,
+over a few dozen sites however big the diagram is.
+
+Finding p's new neighbors takes a few sweeps: starting from the site nearest
+p, which is always one, any sweep that includes some of them and their
+neighbors turns up the next ones along, until no more turn up.
+"""
+
+from dataclasses import dataclass, field
+from typing import Iterable, TypeAlias
+
+from . import voronoi
+from .tools import Coords, sorted_pair
+
+Pair: TypeAlias = tuple[Coords, Coords]
+Wall: TypeAlias = tuple[voronoi.Vertex, voronoi.Vertex]
+
+
+@dataclass
+class VoronoiChange:
+    """What inserting or deleting a site changed.
+
+    cells holds the new cell of each site whose cell changed (a deleted site
+    has none). walls holds the new wall of each pair of sites whose wall
+    changed, or None where the wall is gone or now lies outside the bounds.
+    """
+
+    cells: dict[Coords, list[voronoi.Vertex]] = field(default_factory=dict)
+    walls: dict[Pair, Wall | None] = field(default_factory=dict)
+    added_edges: set[Pair] = field(default_factory=set)
+    removed_edges: set[Pair] = field(default_factory=set)
+
+
+def _read_context(
+    sites: list[Coords], context: voronoi.Context, targets: Iterable[int]
+) -> tuple[
+    dict[Coords, set[Coords]],
+    dict[Coords, list[voronoi.Vertex]],
+    dict[Pair, Wall],
+]:
+    """Get the neighbors, cells and walls of the target sites of a sweep.
+
+    context must have the targets' cells clipped. Walls run the way the
+    second site of their line's pair has them, like GraphMap's.
+    """
+    targets = list(targets)
+    neighbors = {sites[i]: set() for i in targets}
+    for i, j in context.sitePairs:
+        if sites[i] in neighbors:
+            neighbors[sites[i]].add(sites[j])
+        if sites[j] in neighbors:
+            neighbors[sites[j]].add(sites[i])
+
+    cells = {}
+    walls = {}
+    for i in targets:
+        cell = context.cells[i]
+        cells[sites[i]] = cell
+        for k, line in enumerate(context.cellLines[i]):
+            if line == -1:
+                continue
+            start, end = cell[k], cell[(k + 1) % len(cell)]
+            first, second = context.sitePairs[line]
+            walls[sorted_pair(sites[first], sites[second])] = (
+                (start, end) if i == second else (end, start)
+            )
+    return neighbors, cells, walls
+
+
+class IncrementalVoronoi:
+    """The Voronoi diagram of a set of points, clipped to bounds.
+
+    Keeps the Delaunay neighbors of each site, its cell, and the walls
+    between neighbors, and updates them as sites are inserted and deleted.
+    bounds and backend are passed on to voronoi.computeVoronoiContext.
+    """
+
+    bounds: voronoi.Bounds
+    neighbors: dict[Coords, set[Coords]]
+    cells: dict[Coords, list[voronoi.Vertex]]
+    walls: dict[Pair, Wall]
+
+    def __init__(
+        self,
+        points: list[Coords],
+        bounds: voronoi.Bounds,
+        backend: str = "fortune",
+    ):
+        self.bounds = bounds
+        self.backend = backend
+        self.neighbors, self.cells, self.walls = self._sweep(points, points)
+
+    def _sweep(self, sites: Iterable[Coords], targets: Iterable[Coords]):
+        sites = sorted(sites)
+        if not sites:
+            return {}, {}, {}
+        index = {site: i for i, site in enumerate(sites)}
+        targets = [index[target] for target in targets]
+        context = voronoi.computeVoronoiContext(
+            sites, self.backend, strict=True
+        )
+        voronoi.clipCells(context, sites, self.bounds, targets)
+        return _read_context(sites, context, targets)
+
+    def _around(self, sites: set[Coords]) -> set[Coords]:
+        return sites.union(*(self.neighbors[site] for site in sites))
+
+    def delaunay_edges(self) -> set[Pair]:
+        return {
+            sorted_pair(site, neighbor)
+            for site, neighbors in self.neighbors.items()
+            for neighbor in neighbors
+        }
+
+    def _update(
+        self,
+        changed: set[Coords],
+        neighbors: dict[Coords, set[Coords]],
+        cells: dict[Coords, list[voronoi.Vertex]],
+        walls: dict[Pair, Wall],
+        change: VoronoiChange,
+    ) -> VoronoiChange:
+        """Replace what's known about the changed sites with a new sweep's."""
+        for site in changed:
+            old = self.neighbors.get(site, set())
+            for neighbor in old - neighbors[site]:
+                pair = sorted_pair(site, neighbor)
+                change.removed_edges.add(pair)
+                if self.walls.pop(pair, None) is not None:
+                    change.walls[pair] = None
+                self.neighbors[neighbor].discard(site)
+            for neighbor in neighbors[site] - old:
+                change.added_edges.add(sorted_pair(site, neighbor))
+                self.neighbors.setdefault(neighbor, set()).add(site)
+            self.neighbors[site] = neighbors[site]
+
+            for neighbor in neighbors[site]:
+                pair = sorted_pair(site, neighbor)
+                wall = walls.get(pair)
+                if wall != self.walls.get(pair):
+                    change.walls[pair] = wall
+                    if wall is None:
+                        del self.walls[pair]
+                    else:
+                        self.walls[pair] = wall
+            if cells[site] != self.cells.get(site):
+                change.cells[site] = self.cells[site] = cells[site]
+        return change
+
+    def insert(self, point: Coords) -> VoronoiChange:
+        """Add a site at point and return what that changed."""
+        if point in self.neighbors:
+            raise ValueError(f"{point} is already a site")
+        found = set()
+        if self.neighbors:
+            found.add(
+                min(
+                    self.neighbors,
+                    key=lambda site: (
+                        (site.x - point.x) ** 2 + (site.y - point.y) ** 2
+                    ),
+                )
+            )
+        while True:
+            sites = self._around(found) | {point}
+            neighbors, _, _ = self._sweep(sites, [point])
+            if neighbors[point] <= found:
+                break
+            found |= neighbors[point]
+        # Every site that gains point as a neighbor now has all its
+        # neighbors in sites, so one more sweep gets their cells right.
+        changed = neighbors[point] | {point}
+        return self._update(
+            changed, *self._sweep(sites, changed), VoronoiChange()
+        )
+
+    def delete(self, site: Coords) -> VoronoiChange:
+        """Remove a site and return what that changed."""
+        changed = self.neighbors.pop(site)
+        del self.cells[site]
+        change = VoronoiChange()
+        for neighbor in changed:
+            self.neighbors[neighbor].discard(site)
+            pair = sorted_pair(site, neighbor)
+            change.removed_edges.add(pair)
+            if self.walls.pop(pair, None) is not None:
+                change.walls[pair] = None
+        if not changed:
+            return change
+        sites = self._around(changed)
+        return self._update(changed, *self._sweep(sites, changed), change)
@@ -0,0 +1,524 @@
+"""A NumPy backend for voronoi.py.
+
+The Delaunay triangulation is built by inserting points in rounds. It starts
+as a fan from one interior point to the convex hull, flipped until it's
+Delaunay; after that, every triangle with points left inside it takes one of
+them per round. All of a round's splits, and then all the Lawson flips that
+make the triangulation Delaunay again, are done as array operations at once.
+The Voronoi diagram is then read off the triangulation, into a
+voronoi.Context laid out the same way as the sweep's.
+
+Inputs the rounds can't handle (fewer than four points, repeated points, all
+points on the hull) are handed to the sweep instead.
+
+Use it through the voronoi module's backend="numpy" parameter.
+"""
+
+import numpy as np
+
+from . import voronoi
+
+# An edge is only flipped when the in-circle determinant is positive by more
+# than this, relative to the size of its terms, so rounding can't make an
+# edge flip back and forth forever.
+INCIRCLE_EPSILON = 1e-11
+
+# Give up (and let the sweep do it) if flipping hasn't settled by then.
+MAX_FLIP_ROUNDS = 10000
+
+NEXT = np.array([1, 2, 0])
+PREV = np.array([2, 0, 1])
+
+
+def orient(ax, ay, bx, by, cx, cy):
+    """Twice the signed area of abc, positive if it turns counterclockwise."""
+    return (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+
+
+class Triangulation:
+    """A triangulation stored as arrays.
+
+    tri[t] holds the point indices of triangle t, counterclockwise, and
+    adj[t, k] the triangle across the edge opposite tri[t, k] (or -1 on the
+    hull).
+    """
+
+    def __init__(self, xs: np.ndarray, ys: np.ndarray):
+        self.xs = xs
+        self.ys = ys
+        capacity = 2 * len(xs)
+        self.tri = np.empty((capacity, 3), dtype=np.intp)
+        self.adj = np.empty((capacity, 3), dtype=np.intp)
+        self.count = 0
+        # scratch space for marking the triangles a round of splits or flips
+        # is changing
+        self.changed = np.zeros(capacity, dtype=bool)
+        self.best = np.full(capacity, np.iinfo(np.intp).max, dtype=np.intp)
+
+    def orient(self, a, b, c):
+        xs, ys = self.xs, self.ys
+        return orient(xs[a], ys[a], xs[b], ys[b], xs[c], ys[c])
+
+    def fan(self, center: int, hull: np.ndarray):
+        """Start with triangles from center to each edge of the hull."""
+        h = len(hull)
+        ids = np.arange(h)
+        self.tri[:h, 0] = center
+        self.tri[:h, 1] = hull
+        self.tri[:h, 2] = np.roll(hull, -1)
+        self.adj[:h, 0] = -1
+        self.adj[:h, 1] = np.roll(ids, -1)
+        self.adj[:h, 2] = np.roll(ids, 1)
+        self.count = h
+
+    def locate_in_fan(self, center: int, points: np.ndarray) -> np.ndarray:
+        """Find the fan triangle holding each of points."""
+        xs, ys = self.xs, self.ys
+        hull = self.tri[: self.count, 1]
+        hull_angles = np.arctan2(ys[hull] - ys[center], xs[hull] - xs[center])
+        start = np.argmin(hull_angles)
+        order = np.roll(np.arange(self.count), -start)
+        angles = np.arctan2(ys[points] - ys[center], xs[points] - xs[center])
+        found = order[
+            np.searchsorted(hull_angles[order], angles, side="right") - 1
+        ]
+        # Angles are rounded, so check with exact orientations and step over
+        # to the right triangle if needed.
+        return self.locate(points, found)
+
+    def locate(self, points: np.ndarray, start: np.ndarray) -> np.ndarray:
+        """Walk from start to the triangle holding each of points.
+
+        Each step crosses the edge the point is furthest outside of, which
+        always gets there in a Delaunay triangulation.
+        """
+        found = start.copy()
+        active = np.arange(len(points))
+        while active.size:
+            q = points[active]
+            tv = self.tri[found[active]]
+            outside = np.stack(
+                [
+                    self.orient(tv[:, 1], tv[:, 2], q),
+                    self.orient(tv[:, 2], tv[:, 0], q),
+                    self.orient(tv[:, 0], tv[:, 1], q),
+                ],
+                axis=1,
+            )
+            slot = np.argmin(outside, axis=1)
+            moving = outside[np.arange(len(active)), slot] < 0
+            active = active[moving]
+            found[active] = self.adj[found[active], slot[moving]]
+        return found
+
+    def link(self, owner, slot, neighbor):
+        """Repair adj along the outside edges of a round of splits or flips.
+
+        Edge i is now edge slot[i] of triangle owner[i], and neighbor[i] was
+        across it beforehand. An unchanged neighbor is pointed back at the
+        new owner; a neighbor that was changed in the same round has the
+        edge too, so the two new owners are matched up by their shared edge.
+        """
+        tri, adj = self.tri, self.adj
+        e1, e2 = tri[owner, NEXT[slot]], tri[owner, PREV[slot]]
+        adj[owner, slot] = neighbor
+        inside = neighbor >= 0
+
+        fixed = inside.copy()
+        fixed[inside] = ~self.changed[neighbor[inside]]
+        tv = tri[neighbor[fixed]]
+        back = np.argmax(
+            (tv != e1[fixed, None]) & (tv != e2[fixed, None]), axis=1
+        )
+        adj[neighbor[fixed], back] = owner[fixed]
+
+        shared = np.flatnonzero(inside & ~fixed)
+        key = np.minimum(e1[shared], e2[shared]) * len(self.xs) + np.maximum(
+            e1[shared], e2[shared]
+        )
+        pairs = shared[np.argsort(key, kind="stable")].reshape(-1, 2)
+        first, second = pairs[:, 0], pairs[:, 1]
+        adj[owner[first], slot[first]] = owner[second]
+        adj[owner[second], slot[second]] = owner[first]
+
+    def split(self, triangles: np.ndarray, points: np.ndarray):
+        """Split each triangle into three at the matching point.
+
+        Returns the new triangles' outside edges, as (triangles, slots).
+        """
+        tri, adj = self.tri, self.adj
+        m = len(triangles)
+        a, b, c = tri[triangles].T
+        na, nb, nc = adj[triangles].T
+        t1 = np.arange(self.count, self.count + m)
+        t2 = t1 + m
+        self.count += 2 * m
+
+        tri[triangles] = np.stack([a, b, points], axis=1)
+        adj[triangles, :2] = np.stack([t1, t2], axis=1)
+        tri[t1] = np.stack([b, c, points], axis=1)
+        adj[t1, :2] = np.stack([t2, triangles], axis=1)
+        tri[t2] = np.stack([c, a, points], axis=1)
+        adj[t2, :2] = np.stack([triangles, t1], axis=1)
+
+        owners = np.concatenate([triangles, t1, t2])
+        slots = np.full(len(owners), 2)
+        self.changed[triangles] = True
+        self.link(owners, slots, np.concatenate([nc, na, nb]))
+        self.changed[triangles] = False
+        return owners, slots
+
+    def illegal_edges(self, t: np.ndarray, k: np.ndarray):
+        """Pick out the edges that aren't locally Delaunay.
+
+        Edges are given as slots k of triangles t, and returned the same
+        way, along with the triangle u across each and the slot j of u
+        opposite it.
+        """
+        xs, ys = self.xs, self.ys
+        tri, adj = self.tri, self.adj
+        u = adj[t, k]
+        keep = u >= 0
+        t, k, u = t[keep], k[keep], u[keep]
+
+        a, b, c = tri[t, k], tri[t, NEXT[k]], tri[t, PREV[k]]
+        tu = tri[u]
+        j = np.argmax((tu != b[:, None]) & (tu != c[:, None]), axis=1)
+        d = tu[np.arange(len(u)), j]
+
+        adx, ady = xs[a] - xs[d], ys[a] - ys[d]
+        bdx, bdy = xs[b] - xs[d], ys[b] - ys[d]
+        cdx, cdy = xs[c] - xs[d], ys[c] - ys[d]
+        alift = adx * adx + ady * ady
+        blift = bdx * bdx + bdy * bdy
+        clift = cdx * cdx + cdy * cdy
+        det = (
+            alift * (bdx * cdy - cdx * bdy)
+            + blift * (cdx * ady - adx * cdy)
+            + clift * (adx * bdy - bdx * ady)
+        )
+        illegal = det > INCIRCLE_EPSILON * (alift + blift + clift) ** 2
+        return t[illegal], k[illegal], u[illegal], j[illegal]
+
+    def flip(self, t, k, u, j):
+        """Flip the edge opposite tri[t, k], shared with u, for each t.
+
+        Returns the outside edges of the flipped pairs, as (triangles,
+        slots).
+        """
+        tri, adj = self.tri, self.adj
+        a, b, c = tri[t, k], tri[t, NEXT[k]], tri[t, PREV[k]]
+        d = tri[u, j]
+        n_ab, n_ca = adj[t, PREV[k]], adj[t, NEXT[k]]
+        n_bd, n_dc = adj[u, NEXT[j]], adj[u, PREV[j]]
+
+        tri[t] = np.stack([a, b, d], axis=1)
+        adj[t, 1] = u
+        tri[u] = np.stack([a, d, c], axis=1)
+        adj[u, 2] = t
+
+        owners = np.concatenate([t, t, u, u])
+        slots = np.repeat([0, 2, 0, 1], len(t))
+        self.changed[t] = self.changed[u] = True
+        self.link(owners, slots, np.concatenate([n_bd, n_ab, n_dc, n_ca]))
+        self.changed[t] = self.changed[u] = False
+        return owners, slots
+
+    def make_delaunay(self, t: np.ndarray, k: np.ndarray) -> bool:
+        """Flip edges, starting with slots k of triangles t, until all the
+        edges flipping touches are locally Delaunay.
+
+        Each round flips as many illegal edges as it can, as long as no two
+        of them share a triangle. Returns False if that doesn't settle.
+        """
+        best = self.best
+        for _ in range(MAX_FLIP_ROUNDS):
+            t, k, u, j = self.illegal_edges(t, k)
+            if not t.size:
+                return True
+            edge = np.arange(len(t))
+            np.minimum.at(best, t, edge)
+            np.minimum.at(best, u, edge)
+            chosen = (best[t] == edge) & (best[u] == edge)
+            best[t] = best[u] = np.iinfo(np.intp).max
+            flipped_t, flipped_k = self.flip(
+                t[chosen], k[chosen], u[chosen], j[chosen]
+            )
+            # Edges that lost out are checked again, unless a flip changed
+            # one of their triangles, in which case they're outside edges
+            # of that flip already.
+            self.changed[flipped_t] = True
+            waiting = ~chosen & ~self.changed[t] & ~self.changed[u]
+            self.changed[flipped_t] = False
+            t = np.concatenate([flipped_t, t[waiting]])
+            k = np.concatenate([flipped_k, k[waiting]])
+        return False
+
+
+def convex_hull(xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    """Get the indices of points on the convex hull, counterclockwise.
+
+    Points along the hull's edges are included, not just its corners.
+    """
+    # Points strictly inside the polygon of extreme points can't be on the
+    # hull; that usually leaves very few to go through one at a time.
+    extremes = [
+        np.argmin(xs),
+        np.argmin(xs + ys),
+        np.argmin(ys),
+        np.argmax(xs - ys),
+        np.argmax(xs),
+        np.argmax(xs + ys),
+        np.argmax(ys),
+        np.argmin(xs - ys),
+    ]
+    inside = np.ones(len(xs), dtype=bool)
+    for p, q in zip(extremes, extremes[1:] + extremes[:1]):
+        inside &= orient(xs[p], ys[p], xs[q], ys[q], xs, ys) > 0
+    candidates = np.flatnonzero(~inside)
+    candidates = candidates[np.lexsort((ys[candidates], xs[candidates]))]
+    points = list(zip(xs[candidates].tolist(), ys[candidates].tolist()))
+
+    def chain(order):
+        kept = []
+        for i in order:
+            x, y = points[i]
+            while len(kept) >= 2:
+                (ox, oy), (ax, ay) = points[kept[-2]], points[kept[-1]]
+                if orient(ox, oy, ax, ay, x, y) >= 0:
+                    break
+                kept.pop()
+            kept.append(i)
+        return kept
+
+    lower = chain(range(len(points)))
+    upper = chain(reversed(range(len(points))))
+    return candidates[lower[:-1] + upper[:-1]]
+
+
+def triangulate(
+    xs: np.ndarray, ys: np.ndarray
+) -> tuple[np.ndarray, np.ndarray] | None:
+    """Get the Delaunay triangles of the points, as the tri and adj arrays
+    of a Triangulation.
+
+    Returns None for inputs this can't handle.
+    """
+    n = len(xs)
+    if n < 4:
+        return None
+    order = np.lexsort((ys, xs))
+    if np.any((np.diff(xs[order]) == 0) & (np.diff(ys[order]) == 0)):
+        return None
+
+    hull = convex_hull(xs, ys)
+    interior = np.ones(n, dtype=bool)
+    interior[hull] = False
+    interior = np.flatnonzero(interior)
+    if not interior.size or len(np.unique(hull)) != len(hull):
+        return None
+
+    mesh = Triangulation(xs, ys)
+    # Fan out from the interior point nearest the middle of the hull.
+    mid_x, mid_y = xs[hull].mean(), ys[hull].mean()
+    center = interior[
+        np.argmin((xs[interior] - mid_x) ** 2 + (ys[interior] - mid_y) ** 2)
+    ]
+    mesh.fan(center, hull)
+
+    # Insert the rest in a fixed random order, so each triangle's pick is a
+    # random one of its points and the rounds stay few.
+    pending = np.random.default_rng(0).permutation(interior[interior != center])
+    found = mesh.locate_in_fan(center, pending)
+    # The fan's spokes needn't be Delaunay, and rounds only flip edges
+    # around their own splits, so flip them into shape before going on.
+    # Each spoke is slot 1 of one fan triangle.
+    spokes = np.arange(mesh.count)
+    if not mesh.make_delaunay(spokes, np.ones_like(spokes)):
+        return None
+    while pending.size:
+        found = mesh.locate(pending, found)
+        triangles, first = np.unique(found, return_index=True)
+        points = pending[first]
+        rest = np.ones(len(pending), dtype=bool)
+        rest[first] = False
+        pending, found = pending[rest], found[rest]
+        if not mesh.make_delaunay(*mesh.split(triangles, points)):
+            return None
+
+    tri = mesh.tri[: mesh.count]
+    if np.any(mesh.orient(tri[:, 0], tri[:, 1], tri[:, 2]) <= 0):
+        return None
+    return tri, mesh.adj[: mesh.count]
+
+
+def circumcenters(xs, ys, tri):
+    """Get the x and y of the centers of the triangles' circumcircles."""
+    ax, ay = xs[tri[:, 0]], ys[tri[:, 0]]
+    bx, by = xs[tri[:, 1]] - ax, ys[tri[:, 1]] - ay
+    cx, cy = xs[tri[:, 2]] - ax, ys[tri[:, 2]] - ay
+    d = 2 * (bx * cy - by * cx)
+    blift = bx * bx + by * by
+    clift = cx * cx + cy * cy
+    return (
+        ax + (cy * blift - by * clift) / d,
+        ay + (bx * clift - cx * blift) / d,
+    )
+
+
+def sweep_order(xs, ys, tri, adj):
+    """Put the triangles in the order the sweep finds them.
+
+    That's the order of the tops of their circumcircles, bottom to top,
+    and each triangle is rotated to start at the vertex the sweep calls
+    bot: the first one counterclockwise from the top of the circle. The
+    maps built on the triangles depend on their order, so this keeps them
+    the same whichever backend is used.
+
+    Returns the reordered tri and adj, the circumcenters, and the y of the
+    circles' tops.
+    """
+    vx, vy = circumcenters(xs, ys, tri)
+    tops = vy + np.hypot(xs[tri[:, 0]] - vx, ys[tri[:, 0]] - vy)
+    order = np.lexsort((vx, tops))
+    tri, adj, vx, vy, tops = (
+        tri[order],
+        adj[order],
+        vx[order],
+        vy[order],
+        tops[order],
+    )
+    # the extra last entry maps -1 (no neighbor) to itself
+    renumber = np.empty(len(order) + 1, dtype=np.intp)
+    renumber[order] = np.arange(len(order))
+    renumber[-1] = -1
+    adj = renumber[adj]
+
+    angles = np.arctan2(ys[tri] - vy[:, None], xs[tri] - vx[:, None])
+    bot = np.argmin((angles - np.pi / 2) % (2 * np.pi), axis=1)
+    turn = (bot[:, None] + np.arange(3)) % 3
+    rows = np.arange(len(tri))[:, None]
+    return tri[rows, turn], adj[rows, turn], vx, vy, tops
+
+
+def computeVoronoiContext(points, strict=False) -> voronoi.Context:
+    """Like voronoi.computeVoronoiContext, but built from a triangulation.
+
+    Everything comes out as the sweep would give it, in the same order,
+    up to rounding: Voronoi vertex i is the circumcenter of triangle i,
+    each line is scaled so a or b is 1, and an edge's first vertex is its
+    left end (its top end, for vertical lines). strict is passed on to the
+    sweep, for inputs handed over to it.
+    """
+    xs = np.array([p.x for p in points], dtype=float)
+    ys = np.array([p.y for p in points], dtype=float)
+    result = triangulate(xs, ys)
+    if result is None:
+        context = voronoi.Context()
+        voronoi.voronoi(voronoi.SiteList(points), context, strict)
+        return context
+    tri, adj = result
+
+    tri, adj, vx, vy, tops = sweep_order(xs, ys, tri, adj)
+    context = voronoi.Context()
+    context.vertices = list(zip(vx.tolist(), vy.tolist()))
+    # (bot, top, mid), like the sweep's outTriple
+    context.triangles = list(map(tuple, tri[:, [0, 2, 1]].tolist()))
+
+    # One Voronoi edge per Delaunay edge: between the circumcenters of the
+    # triangles on either side, or a ray out from a hull edge's triangle.
+    # Here t is the earlier triangle of the two (or the only one), and k the
+    # edge's slot in it.
+    t = np.repeat(np.arange(len(tri)), 3)
+    k = np.tile(np.arange(3), len(tri))
+    u = adj.ravel()
+    keep = (u < 0) | (t < u)
+    t, k, u = t[keep], k[keep], u[keep]
+    p, q = tri[t, NEXT[k]], tri[t, PREV[k]]
+    # order each pair of sites bottom first, as the sweep does
+    swap = (ys[q] < ys[p]) | ((ys[q] == ys[p]) & (xs[q] < xs[p]))
+    s1, s2 = np.where(swap, q, p), np.where(swap, p, q)
+
+    # Number the lines in the order the sweep makes them: a triangle's
+    # (bot, top) edge at its circle event, the rest at the site event of
+    # their upper site, and circle events first on ties.
+    circle = k == 1
+    made = np.lexsort(
+        (
+            ~circle,
+            np.where(circle, vx[t], xs[s2]),
+            np.where(circle, tops[t], ys[s2]),
+        )
+    )
+    t, k, u, p, q, s1, s2 = (
+        t[made],
+        k[made],
+        u[made],
+        p[made],
+        q[made],
+        s1[made],
+        s2[made],
+    )
+
+    dx, dy = xs[s2] - xs[s1], ys[s2] - ys[s1]
+    c = xs[s1] * dx + ys[s1] * dy + (dx * dx + dy * dy) * 0.5
+    steep = np.abs(dx) > np.abs(dy)
+    safe_dx = np.where(steep, dx, 1.0)
+    safe_dy = np.where(steep, 1.0, dy)
+    a = np.where(steep, 1.0, dx / safe_dy)
+    b = np.where(steep, dy / safe_dx, 1.0)
+    c = np.where(steep, c / safe_dx, c / safe_dy)
+    vertical = steep & (b == 0)
+
+    # Finite edges: the left end first, or the top end if vertical.
+    ray = u < 0
+    later = np.where(ray, 0, u)
+    t_first = np.where(vertical, vy[t] >= vy[later], vx[t] <= vx[later])
+    v1 = np.where(t_first, t, u)
+    v2 = np.where(t_first, u, t)
+    # Rays head out of the hull, to the right of edge p -> q, and the end at
+    # infinity is -1.
+    nx, ny = ys[q] - ys[p], xs[p] - xs[q]
+    towards_first = np.where(nx == 0, ny > 0, nx < 0)
+    v1 = np.where(ray, np.where(towards_first, -1, t), v1)
+    v2 = np.where(ray, np.where(towards_first, t, -1), v2)
+
+    # The sweep outputs a finite edge at the circle event of its later
+    # triangle, where (bot, mid) is finished before (mid, top). Rays come
+    # last, clockwise around the hull from its lowest point.
+    tu = tri[later]
+    bot_mid = (tu[:, 0] == p) | (tu[:, 0] == q)
+    bot_mid &= (tu[:, 1] == p) | (tu[:, 1] == q)
+    rays = np.flatnonzero(ray)
+    ray_ending_at = dict(zip(q[rays].tolist(), rays.tolist()))
+    site = np.lexsort((xs, ys))[0]
+    rank = np.empty(len(t), dtype=np.intp)
+    for i in range(len(rays)):
+        edge = ray_ending_at[site]
+        rank[edge] = i
+        site = p[edge]
+    emitted = np.lexsort((~bot_mid, np.where(ray, len(tri) + rank, later)))
+
+    context.lines = list(zip(a.tolist(), b.tolist(), c.tolist()))
+    context.sitePairs = list(zip(s1.tolist(), s2.tolist()))
+    context.bisectors = [
+        ((x1, y1), (x2, y2))
+        for x1, y1, x2, y2 in zip(
+            xs[s1].tolist(), ys[s1].tolist(), xs[s2].tolist(), ys[s2].tolist()
+        )
+    ]
+    context.edges = list(
+        zip(
+            emitted.tolist(),
+            v1[emitted].tolist(),
+            v2[emitted].tolist(),
+        )
+    )
+    polygons = {}
+    for edge, site1, site2 in zip(
+        context.edges, s1[emitted].tolist(), s2[emitted].tolist()
+    ):
+        polygons.setdefault(site1, []).append(edge)
+        polygons.setdefault(site2, []).append(edge)
+    context.polygons = polygons
+    return context
@@ -0,0 +1,460 @@
+"""Maps of an unbounded world, generated a chunk at a time.
+
+The world is cut into chunks the size of the window. Each chunk gets its own
+Poisson points, drawn from a seed derived from the world seed and the chunk's
+position, and inset by half the minimum distance so that points of adjacent
+chunks are still far enough apart. A chunk's cells, walls and edges are worked
+out from one Voronoi sweep over the points of the chunk and its eight
+neighbors, so cells along a seam come out the same as if the whole world had
+been swept at once.
+
+Only chunks near the player are kept in the map's graphs; far ones are evicted
+and regenerated identically if the player comes back.
+
+If the sweep of a chunk's block fails validation, it starts over from new
+points, like GraphMap: one chunk of the block, the chunk itself unless it's
+loaded, is sampled again from a seed with the attempt number in it, and
+everything built from that chunk's old points is rebuilt. Attempts are kept
+while the map lives, but which chunk was resampled can depend on the order
+chunks were loaded in.
+
+Working out a chunk takes a while, so it can be done ahead of time on another
+thread: build_records does the work without touching the map, and
+add_records hands the results over, after which update only has to add them
+to the graphs.
+"""
+
+import random
+from dataclasses import dataclass
+from itertools import combinations, product
+from math import ceil, floor
+from typing import Callable, TypeAlias
+
+import networkx as nx
+
+from . import voronoi
+from .map import (
+    GENERATION_ATTEMPTS,
+    ForestMap,
+    crosses_multiple_walls,
+    prune_long_edges,
+)
+from .poisson.poisson_disk import sample_poisson_uniform
+from .tools import WINDOW_SIZE, Coords, SegmentGrid, Size, sorted_pair
+
+Chunk: TypeAlias = tuple[int, int]
+Pair: TypeAlias = tuple[Coords, Coords]
+
+
+@dataclass
+class ChunkRecord:
+    """Everything a chunk contributes to the world map.
+
+    Facts about a pair of neighboring nodes are only recorded by the chunk
+    that owns the pair, which is the chunk holding its lesser node. That way
+    pairs straddling a seam are worked out exactly once.
+    """
+
+    nodes: list[Coords]
+    wall_dict: dict[Coords, list[Pair]]
+    cells: dict[Coords, list[Coords]]
+    # walls between owned pairs
+    walls: dict[Pair, Pair]
+    # owned pairs joined by an edge, and whether it survives pruning
+    edges: dict[Pair, bool]
+    # the attempt the points of each chunk of the block were sampled at
+    attempts: dict[Chunk, int]
+
+
+def _neighborhood(chunk: Chunk, radius: int) -> list[Chunk]:
+    cx, cy = chunk
+    return [
+        (cx + dx, cy + dy)
+        for dx, dy in product(range(-radius, radius + 1), repeat=2)
+    ]
+
+
+class TiledForestMap(ForestMap):
+    """A ForestMap over an unbounded world, generated around the player.
+
+    Call update with the player's location whenever it changes: chunks
+    within load_distance of it are generated and added, and chunks further
+    than evict_distance away are dropped. To keep the generating off the
+    caller's thread, pass missing_records(location) to build_records on
+    another thread, and the result to add_records, before calling update.
+    """
+
+    def __init__(
+        self,
+        *,
+        seed: int,
+        start: Coords | None = None,
+        chunk_dims: Size = WINDOW_SIZE,
+        min_distance: float | None = None,
+        load_distance: float | None = None,
+        evict_distance: float | None = None,
+    ):
+        self.seed = seed
+        self.dims = chunk_dims
+        self.margin = 0
+        self.min_distance = min_distance or sum(chunk_dims) / 18
+        self.load_distance = load_distance or min(chunk_dims) / 3
+        self.evict_distance = evict_distance or max(chunk_dims)
+        self.graph = nx.Graph()
+        self.adjacency = nx.Graph()
+        self.wall_dict = {}
+        self.cells = {}
+        self.loaded: set[Chunk] = set()
+        self._walls: dict[Pair, Pair] = {}
+        self._records: dict[Chunk, ChunkRecord] = {}
+        # chunks whose points were sampled again, and how many times
+        self._attempts: dict[Chunk, int] = {}
+        # the records of loaded chunks that add_records has replaced, until
+        # update reloads them
+        self._replaced: dict[Chunk, ChunkRecord] = {}
+        self._node_type = None
+        self.update(start or Coords(chunk_dims.w / 2, chunk_dims.h / 2))
+
+    @property
+    def walls(self) -> list[Pair]:
+        return list(self._walls.values())
+
+    def chunk_of(self, location: Coords) -> Chunk:
+        return (
+            floor(location.x / self.dims.w),
+            floor(location.y / self.dims.h),
+        )
+
+    def chunk_origin(self, chunk: Chunk) -> Coords:
+        cx, cy = chunk
+        return Coords(cx * self.dims.w, cy * self.dims.h)
+
+    def _distance_to_chunk(self, location: Coords, chunk: Chunk) -> float:
+        origin = self.chunk_origin(chunk)
+        dx = max(origin.x - location.x, 0, location.x - origin.x - self.dims.w)
+        dy = max(origin.y - location.y, 0, location.y - origin.y - self.dims.h)
+        return (dx * dx + dy * dy) ** 0.5
+
+    def _wanted(self, location: Coords) -> set[Chunk]:
+        """The chunks within load_distance of location."""
+        reach = ceil(self.load_distance / min(self.dims)) + 1
+        return {
+            chunk
+            for chunk in _neighborhood(self.chunk_of(location), reach)
+            if self._distance_to_chunk(location, chunk) <= self.load_distance
+        }
+
+    def _current(self, record: ChunkRecord) -> bool:
+        """Whether record was built from the points its block has now."""
+        return all(
+            self._attempts.get(chunk, 0) == attempt
+            for chunk, attempt in record.attempts.items()
+        )
+
+    def missing_records(self, location: Coords) -> list[Chunk]:
+        """The chunks whose records update(location) would have to build."""
+        loading = (
+            (self._wanted(location) - self.loaded)
+            | self._replaced.keys()
+            | {
+                chunk
+                for chunk in self.loaded
+                if not self._current(self._records[chunk])
+            }
+        )
+        return sorted(
+            {
+                c
+                for chunk in loading
+                for c in _neighborhood(chunk, 1)
+                if c not in self._records or not self._current(self._records[c])
+            }
+        )
+
+    def build_records(self, chunks: list[Chunk]) -> dict[Chunk, ChunkRecord]:
+        """Work out the records of chunks, for add_records.
+
+        This leaves the map alone, so it can run on another thread while
+        the map is in use.
+        """
+        attempts = dict(self._attempts)
+        loaded = set(self.loaded)
+        points: dict[tuple[Chunk, int], list[Coords]] = {}
+
+        def chunk_points(chunk: Chunk) -> list[Coords]:
+            key = (chunk, attempts.get(chunk, 0))
+            if key not in points:
+                points[key] = self._sample_chunk(*key)
+            return points[key]
+
+        records: dict[Chunk, ChunkRecord] = {}
+        pending = list(chunks)
+        while pending:
+            chunk = pending.pop()
+            records[chunk] = self._build_record(
+                chunk, chunk_points, attempts, loaded
+            )
+            # Records built before a chunk of their block was sampled again
+            # have to be built again too.
+            pending += [
+                c
+                for c, record in records.items()
+                if c not in pending
+                and any(
+                    attempts.get(n, 0) != attempt
+                    for n, attempt in record.attempts.items()
+                )
+            ]
+        return records
+
+    def add_records(self, records: dict[Chunk, ChunkRecord]):
+        """Keep records from build_records for the next update to use."""
+        for record in records.values():
+            for chunk, attempt in record.attempts.items():
+                if attempt > self._attempts.get(chunk, 0):
+                    self._attempts[chunk] = attempt
+        for chunk, record in records.items():
+            old = self._records.get(chunk)
+            if not self._current(record) or (old and self._current(old)):
+                # built from points that have changed since, or not needed
+                continue
+            if chunk in self.loaded and chunk not in self._replaced:
+                self._replaced[chunk] = old
+            self._records[chunk] = record
+
+    def update(self, location: Coords) -> bool:
+        """Load and evict chunks around location.
+
+        Returns whether any chunk was loaded or evicted.
+        """
+        missing = self.missing_records(location)
+        while missing:
+            self.add_records(self.build_records(missing))
+            missing = self.missing_records(location)
+
+        wanted = self._wanted(location)
+        stale = {
+            chunk
+            for chunk in self.loaded
+            if self._distance_to_chunk(location, chunk) > self.evict_distance
+        }
+        # loaded chunks whose records were rebuilt from new points
+        reloading = set(self._replaced) - stale
+        for chunk in stale | reloading:
+            self._evict(chunk)
+        new = (wanted - self.loaded) | reloading
+        for chunk in sorted(new):
+            self._load(chunk)
+        if new and self._node_type:
+            self._cleanup_nodes(self._node_type, self._cleanup_rng(new))
+
+        # Keep only what loaded chunks (and chunks they'd need) depend on.
+        keep_records = {
+            c for chunk in self.loaded for c in _neighborhood(chunk, 1)
+        }
+        self._records = {
+            c: r for c, r in self._records.items() if c in keep_records
+        }
+        return bool(stale or new)
+
+    def _sample_chunk(self, chunk: Chunk, attempt: int = 0) -> list[Coords]:
+        cx, cy = chunk
+        seed = f"{self.seed}:{cx}:{cy}" + (f":{attempt}" if attempt else "")
+        inset = ceil(self.min_distance / 2)
+        origin = self.chunk_origin(chunk)
+        samples = sample_poisson_uniform(
+            self.dims.w - 2 * inset,
+            self.dims.h - 2 * inset,
+            self.min_distance,
+            30,
+            rng=random.Random(seed),
+        )
+        return [
+            Coords(floor(origin.x + inset + x), floor(origin.y + inset + y))
+            for x, y in samples
+        ]
+
+    def _build_record(
+        self,
+        chunk: Chunk,
+        chunk_points: Callable[[Chunk], list[Coords]],
+        attempts: dict[Chunk, int],
+        loaded: set[Chunk],
+    ) -> ChunkRecord:
+        """Work out a chunk's record from the points chunk_points gives.
+
+        If the sweep fails, one chunk of the block that isn't in loaded
+        (this one if it can be) is sampled again, by counting up its entry
+        in attempts.
+        """
+        block = _neighborhood(chunk, 1)
+        for attempt in range(GENERATION_ATTEMPTS):
+            center = chunk_points(chunk)
+            points = [
+                point
+                for block_chunk in block
+                for point in chunk_points(block_chunk)
+            ]
+            try:
+                context = voronoi.computeVoronoiContext(points, strict=True)
+                break
+            except voronoi.VoronoiError:
+                if attempt == GENERATION_ATTEMPTS - 1:
+                    raise
+                resample = next(
+                    (c for c in [chunk, *block] if c not in loaded), chunk
+                )
+                attempts[resample] = attempts.get(resample, 0) + 1
+        in_center = set(center)
+        # the block's bounds, which only cells outside the chunk reach
+        low = self.chunk_origin((chunk[0] - 1, chunk[1] - 1))
+        high = self.chunk_origin((chunk[0] + 2, chunk[1] + 2))
+        center_sites = [
+            i for i, point in enumerate(points) if point in in_center
+        ]
+        voronoi.clipCells(
+            context, points, (low.x, low.y, high.x, high.y), center_sites
+        )
+
+        block_walls: dict[Pair, Pair] = {}
+        for line, v1, v2 in context.edges:
+            if v1 == -1 or v2 == -1:
+                # only happens on the outside of the block
+                continue
+            site1, site2 = context.sitePairs[line]
+            block_walls[sorted_pair(points[site1], points[site2])] = (
+                Coords(*context.vertices[v1]),
+                Coords(*context.vertices[v2]),
+            )
+
+        wall_dict = {node: [] for node in center}
+        for (n1, n2), wall in block_walls.items():
+            for node in (n1, n2):
+                if node in in_center:
+                    wall_dict[node].append(wall)
+
+        # Walls on the outside of the block can be very long, but only walls
+        # close to the chunk can cross its edges.
+        wall_index = SegmentGrid(
+            [
+                wall
+                for pair, wall in block_walls.items()
+                if any(
+                    self._distance_to_chunk(node, chunk)
+                    <= 4 * self.min_distance
+                    for node in pair
+                )
+            ],
+            self.min_distance,
+        )
+        delaunay = {
+            sorted_pair(points[i], points[j])
+            for triangle in context.triangles
+            for i, j in combinations(triangle, 2)
+        }
+        owned_edges = [
+            pair
+            for pair in sorted(delaunay)
+            if pair[0] in in_center
+            and not crosses_multiple_walls(pair, wall_index)
+        ]
+
+        # Only prune edges inside the chunk, so that whether an edge is kept
+        # never depends on what other chunks are loaded.
+        interior = nx.Graph()
+        interior.add_nodes_from(center)
+        interior.add_edges_from(
+            pair for pair in owned_edges if pair[1] in in_center
+        )
+        prune_long_edges(interior, 2 * self.min_distance**2)
+
+        return ChunkRecord(
+            nodes=center,
+            wall_dict=wall_dict,
+            cells={
+                points[site]: [Coords(*vertex) for vertex in cell]
+                for site, cell in context.cells.items()
+            },
+            walls={
+                pair: wall
+                for pair, wall in block_walls.items()
+                if pair[0] in in_center
+            },
+            edges={
+                pair: pair[1] not in in_center or interior.has_edge(*pair)
+                for pair in owned_edges
+            },
+            attempts={c: attempts.get(c, 0) for c in block},
+        )
+
+    def _touching(self, pair: Pair, chunk: Chunk) -> bool:
+        return chunk in (self.chunk_of(pair[0]), self.chunk_of(pair[1]))
+
+    def _load(self, chunk: Chunk):
+        record = self._records[chunk]
+        self.loaded.add(chunk)
+        self.graph.add_nodes_from(record.nodes)
+        self.adjacency.add_nodes_from(record.nodes)
+        self.wall_dict.update(record.wall_dict)
+        self.cells.update(record.cells)
+
+        for owner in _neighborhood(chunk, 1):
+            owner_record = self._records[owner]
+            for pair, wall in owner_record.walls.items():
+                if self._touching(pair, chunk):
+                    self._walls[pair] = wall
+            for pair, kept in owner_record.edges.items():
+                if not self._touching(pair, chunk) or not all(
+                    self.chunk_of(node) in self.loaded for node in pair
+                ):
+                    continue
+                attrs = {}
+                if pair in owner_record.walls:
+                    attrs["wall"] = owner_record.walls[pair]
+                self.adjacency.add_edge(*pair, **attrs)
+                if kept:
+                    self.graph.add_edge(*pair, **attrs)
+
+        if self._node_type:
+            self._label_chunk(chunk)
+
+    def _evict(self, chunk: Chunk):
+        # the record the chunk was loaded from
+        record = self._replaced.pop(chunk, None) or self._records[chunk]
+        self.loaded.discard(chunk)
+        self.graph.remove_nodes_from(record.nodes)
+        self.adjacency.remove_nodes_from(record.nodes)
+        for node in record.nodes:
+            del self.wall_dict[node]
+            del self.cells[node]
+        for pair in list(self._walls):
+            if self._touching(pair, chunk) and not any(
+                self.chunk_of(node) in self.loaded for node in pair
+            ):
+                del self._walls[pair]
+
+    def _label_chunk(self, chunk: Chunk):
+        cx, cy = chunk
+        rng = random.Random(f"{self.seed}:{cx}:{cy}:labels")
+        nx.set_node_attributes(
+            self.graph,
+            {n: self._node_type(rng=rng) for n in self._records[chunk].nodes},
+            "label",
+        )
+
+    def _cleanup_rng(self, chunks: set[Chunk]) -> random.Random:
+        """The Random to repair labels with after loading chunks."""
+        return random.Random(f"{self.seed}:{sorted(chunks)}:cleanup")
+
+    def add_labels(self, nodeType, rng=None):
+        """Label the loaded nodes, and any loaded later, with nodeType.
+
+        Labels are drawn per chunk, from Randoms seeded by the world's seed,
+        so rng is ignored. Repairing ambiguous labels looks at whatever is
+        loaded, though, so nodes near a seam may be labeled differently when
+        their chunk is regenerated.
+        """
+        self._node_type = nodeType
+        for chunk in sorted(self.loaded):
+            self._label_chunk(chunk)
+        self._cleanup_nodes(nodeType, self._cleanup_rng(self.loaded))